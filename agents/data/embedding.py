@@ -1,16 +1,14 @@
 import numpy as np 
-from typing import List, Dict, Optional, Tuple 
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator 
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from enum import Enum 
 import logging 
 from backend.app.models.user_embedding import UserEmbedding
-from backend.app.services.db_service import update_user_embedding, get_db
-from langchain_huggingface import HuggingFaceEmbeddings
+from backend.app.services.db_service import update_user_embedding, get_db, get_embedding, get_seen_paper_ids
 from langchain_postgres import PGVector
 import os 
 from dotenv import load_dotenv
-from langchain_community.vectorstores import FAISS
 from backend.app.services.handle_interaction import interac_with_paper
 import torch
 from sentence_transformers import SentenceTransformer
@@ -18,8 +16,16 @@ from PIL import Image
 from transformers import CLIPProcessor, CLIPModel, AutoTokenizer, AutoModel
 from typing import List, Dict
 from pathlib import Path
+from agents.data.embedding_cache import EmbeddingCache, content_key
+from agents.data.vector_db import get_paper_lookup
+from agents.data.onnx_backend import DEFAULT_ONNX_DIR, OnnxEncoder, export_encoders
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 load_dotenv()
 
+DEFAULT_EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
 class InteractionType(Enum):
     LIKE = 1.0
     DISLIKE = -0.5
@@ -126,6 +132,54 @@ class UserEmbeddingService:
         return weighted_embeddings 
     
     
+    def current_embeddings(self, user_ids: List[str], rows: Dict[str, UserEmbedding]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batched _get_user_embedding + the age used by _apply_temporal_decay:
+        a (n_users, dim) matrix of current embeddings (random init for users
+        without a valid one) and the days since each was last updated.
+        """
+        current = np.empty((len(user_ids), self.embedding_dim), dtype=np.float64)
+        days_since_update = np.zeros(len(user_ids))
+        now = datetime.utcnow()
+        for i, user_id in enumerate(user_ids):
+            row = rows.get(user_id)
+            if row is not None and row.embedding and len(row.embedding) == self.embedding_dim:
+                current[i] = row.embedding
+            else:
+                current[i] = np.random.normal(0, 0.01, self.embedding_dim)
+            if row is not None and row.updated_at:
+                updated_at = row.updated_at.replace(tzinfo=None) if row.updated_at.tzinfo is not None else row.updated_at
+                days_since_update[i] = (now - updated_at).days
+        return current, days_since_update
+
+    def batch_update_embeddings(self,
+                                current: np.ndarray,
+                                days_since_update: np.ndarray,
+                                user_index: np.ndarray,
+                                paper_embeddings: np.ndarray,
+                                weights: np.ndarray) -> np.ndarray:
+        """
+        update_user_embedding for many users at once: event i (a paper
+        embedding with its interaction weight) belongs to user user_index[i];
+        each user with events moves by one EMA step towards the mean of their
+        weighted embeddings, then decay and normalization apply to all rows.
+        """
+        if paper_embeddings.shape[1] != current.shape[1]:
+            raise ValueError(f"Paper embedding dimension {paper_embeddings.shape[1]} doesn't match expected {current.shape[1]}")
+
+        sums = np.zeros_like(current)
+        np.add.at(sums, user_index, paper_embeddings * weights[:, None])
+        counts = np.bincount(user_index, minlength=len(current))[:, None]
+        averages = sums / np.maximum(counts, 1)
+
+        alpha = self.learning_rate
+        updated = np.where(counts > 0, (1 - alpha) * current + alpha * averages, current)
+        # Monthly decay with minimum threshold, as in _apply_temporal_decay
+        updated *= np.maximum(0.1, self.decay_factor ** (days_since_update / 30))[:, None]
+
+        norms = np.linalg.norm(updated, axis=1, keepdims=True)
+        return np.where(norms > 1e-8, updated / np.maximum(norms, 1e-8), updated)
+
     def _exponential_moving_average_update(self, 
                                          current_embedding: np.ndarray,
                                          new_embeddings: List[np.ndarray]) -> np.ndarray:
@@ -218,6 +272,35 @@ class UserEmbeddingService:
         
         return relevance_score
 
+    def get_paper_relevance_scores(self,
+                                   user_embedding: np.ndarray,
+                                   paper_embeddings: np.ndarray) -> np.ndarray:
+        """Batched get_paper_relevance_score: one (n_papers, dim) matrix, one matmul."""
+        paper_embeddings = np.atleast_2d(np.asarray(paper_embeddings, dtype=np.float32))
+        if paper_embeddings.shape[1] != user_embedding.shape[0]:
+            self.logger.error("User and paper embedding dimensions don't match")
+            return np.zeros(len(paper_embeddings), dtype=np.float32)
+
+        user_norm = np.linalg.norm(user_embedding)
+        paper_norms = np.linalg.norm(paper_embeddings, axis=1)
+        if user_norm < 1e-8:
+            return np.full(len(paper_embeddings), 0.5, dtype=np.float32)
+
+        cosine_sims = paper_embeddings @ (user_embedding / user_norm).astype(np.float32)
+        # Zero vectors score as orthogonal, like calculate_user_similarity
+        cosine_sims = np.where(paper_norms < 1e-8, 0.0, cosine_sims / np.maximum(paper_norms, 1e-8))
+        return (np.clip(cosine_sims, -1.0, 1.0) + 1) / 2
+
+    @staticmethod
+    def top_k_indices(scores: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+        """Indices of the `top_k` highest scores, best first (all of them if top_k is None)."""
+        if top_k is not None and top_k < len(scores):
+            if top_k <= 0:
+                return np.empty(0, dtype=np.int64)
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+            return candidates[np.argsort(-scores[candidates], kind="stable")]
+        return np.argsort(-scores, kind="stable")
+
 
 
 #=====================
@@ -231,59 +314,298 @@ class MultimodalEmbedder:
     - Text: BGE (semantic text embeddings).
     - Images: CLIP.
     - Text (CLIP): optional, for cross-modal search (text <-> images).
+
+    Text inputs are tokenized once, sorted by token length and run in
+    micro-batches of `batch_size`, so each batch is only padded to its own
+    longest input; results come back in input order. `batch_size=None` runs
+    everything as one batch.
+
+    With an EmbeddingCache, every input is first looked up by (model name,
+    sha256 of the chunk text / image bytes) and only the misses reach the
+    models, so re-ingesting a paper costs almost no model time.
+
+    `backend="onnx"` runs the three encoders with ONNX Runtime on CPU instead
+    of PyTorch, int8-quantized unless `quantize=False`. The graphs are
+    exported under `onnx_dir` on first use, so only that first run needs the
+    PyTorch weights. Cached vectors are kept per backend.
+
+    The BGE and CLIP towers are loaded on first use (thread-safe), so a
+    text-only workload never loads CLIP. Use get_embedder() to share one
+    instance per process rather than constructing new ones.
     """
 
+    BACKENDS = ("torch", "onnx")
+
     def __init__(
         self,
         img_model_name: str = "openai/clip-vit-base-patch32",
-        text_model_name: str = "BAAI/bge-small-en-v1.5"
+        text_model_name: str = "BAAI/bge-small-en-v1.5",
+        batch_size: Optional[int] = 32,
+        cache: Optional[EmbeddingCache] = None,
+        backend: str = "torch",
+        quantize: bool = True,
+        onnx_dir: str = DEFAULT_ONNX_DIR
     ):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-
-        # --- Image/Text model (CLIP) ---
-        self.clip_model = CLIPModel.from_pretrained(img_model_name).to(self.device)
-        self.clip_processor = CLIPProcessor.from_pretrained(img_model_name)
-
-        # --- Text model (BGE or other) ---
-        self.text_tokenizer = AutoTokenizer.from_pretrained(text_model_name)
-        self.text_model = AutoModel.from_pretrained(text_model_name).to(self.device)
-
-    def embed_text(self, texts: List[str]) -> List[List[float]]:
-        """Embed text using BGE (semantic retrieval)."""
-        inputs = self.text_tokenizer(
-            texts,
-            padding=True,
-            truncation=True,
-            return_tensors="pt",
-            max_length=512
-        ).to(self.device)
-
-        with torch.no_grad():
-            model_output = self.text_model(**inputs)
-            embeddings = model_output.last_hidden_state.mean(dim=1)  # mean pooling
-            embeddings = embeddings / embeddings.norm(p=2, dim=-1, keepdim=True)
-
-        return embeddings.cpu().numpy().tolist()
-
-    def embed_text_using_clip(self, texts: List[str]) -> List[List[float]]:
-        """Embed text using CLIP (for cross-modal text <-> image retrieval)."""
-        inputs = self.clip_processor(
-            text=texts,
-            return_tensors="pt",
-            padding=True,
-            truncation=True
-        ).to(self.device)
-
-        with torch.no_grad():
-            embeddings = self.clip_model.get_text_features(**inputs)
-            embeddings = embeddings / embeddings.norm(p=2, dim=-1, keepdim=True)
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}, got {backend!r}")
+
+        self.batch_size = batch_size
+        self.cache = cache
+        self.backend = backend
+        self.quantize = quantize
+        self.onnx_dir = onnx_dir
+        self.device = "cuda" if backend == "torch" and torch.cuda.is_available() else "cpu"
+        self.img_model_name = img_model_name
+        self.text_model_name = text_model_name
+
+        # Cache namespaces: int8 / ONNX vectors are close to, not equal to, the torch ones
+        tag = "" if backend == "torch" else ("@onnx-int8" if quantize else "@onnx")
+        self.text_key = text_model_name + tag
+        self.clip_text_key = f"{img_model_name}:text{tag}"
+        self.clip_image_key = f"{img_model_name}:image{tag}"
+
+        # Tower name -> its loaded tokenizer / models, filled on first use
+        self._towers: Dict[str, Dict[str, object]] = {}
+        self._tower_locks = {"text": threading.Lock(), "clip": threading.Lock()}
+
+    def _tower(self, name: str) -> Dict[str, object]:
+        tower = self._towers.get(name)
+        if tower is None:
+            with self._tower_locks[name]:
+                # Another thread may have loaded it while we waited
+                tower = self._towers.get(name)
+                if tower is None:
+                    tower = self._load_text_tower() if name == "text" else self._load_clip_tower()
+                    self._towers[name] = tower
+        return tower
+
+    def _load_text_tower(self) -> Dict[str, object]:
+        """BGE (or other) text model."""
+        tower = {"tokenizer": AutoTokenizer.from_pretrained(self.text_model_name)}
+        if self.backend == "onnx":
+            paths = export_encoders(self.img_model_name, self.text_model_name, self.onnx_dir, self.quantize, encoders=("text",))
+            tower["onnx"] = OnnxEncoder(paths["text"])
+        else:
+            tower["model"] = AutoModel.from_pretrained(self.text_model_name).to(self.device)
+        return tower
+
+    def _load_clip_tower(self) -> Dict[str, object]:
+        """CLIP image / text model."""
+        tower = {"processor": CLIPProcessor.from_pretrained(self.img_model_name)}
+        if self.backend == "onnx":
+            paths = export_encoders(self.img_model_name, self.text_model_name, self.onnx_dir, self.quantize,
+                                    encoders=("clip_text", "clip_vision"))
+            tower["onnx_text"] = OnnxEncoder(paths["clip_text"])
+            tower["onnx_vision"] = OnnxEncoder(paths["clip_vision"])
+        else:
+            tower["model"] = CLIPModel.from_pretrained(self.img_model_name).to(self.device)
+        return tower
+
+    @property
+    def text_tokenizer(self):
+        return self._tower("text")["tokenizer"]
+
+    @property
+    def text_model(self):
+        return self._tower("text")["model"]
+
+    @property
+    def onnx_text(self) -> OnnxEncoder:
+        return self._tower("text")["onnx"]
+
+    @property
+    def clip_processor(self):
+        return self._tower("clip")["processor"]
+
+    @property
+    def clip_model(self):
+        return self._tower("clip")["model"]
+
+    @property
+    def onnx_clip_text(self) -> OnnxEncoder:
+        return self._tower("clip")["onnx_text"]
+
+    @property
+    def onnx_clip_vision(self) -> OnnxEncoder:
+        return self._tower("clip")["onnx_vision"]
+
+    @property
+    def loaded_towers(self) -> List[str]:
+        return sorted(self._towers)
+
+    def _length_buckets(self, encodings) -> List[np.ndarray]:
+        """Input indices sorted by token length, split into micro-batches."""
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        order = np.argsort(lengths, kind="stable")
+        size = self.batch_size or len(order)
+        return [order[start:start + size] for start in range(0, len(order), size)]
+
+    def _pad_bucket(self, tokenizer, encodings, bucket: np.ndarray):
+        """Pad one micro-batch to its longest member and move it to the device."""
+        features = {key: [encodings[key][i] for i in bucket] for key in encodings.keys()}
+        if self.backend == "onnx":
+            return tokenizer.pad(features, padding=True, return_tensors="np")
+        return tokenizer.pad(features, padding=True, return_tensors="pt").to(self.device)
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        return embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+    def _cached(self, model: str, contents: List[bytes], compute) -> List[List[float]]:
+        """
+        Embed through the cache: look every input up by content hash, run
+        `compute(indices)` on the misses only (each distinct input once), store them.
+        """
+        if self.cache is None:
+            return compute(list(range(len(contents))))
+
+        keys = [content_key(data) for data in contents]
+        found = self.cache.get_many(model, keys)
+        first_seen: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                first_seen.setdefault(key, i)
+        if first_seen:
+            computed = compute(list(first_seen.values()))
+            new = dict(zip(first_seen.keys(), computed))
+            self.cache.put_many(model, new)
+            found.update(new)
+        return [found[key] for key in keys]
+
+    def embed_text(self, texts: List[str], cache: bool = True) -> List[List[float]]:
+        """
+        Embed text using BGE (semantic retrieval).
 
-        return embeddings.cpu().numpy().tolist()
+        `cache=False` bypasses the persistent cache, e.g. for queries, which
+        are cached in process by QueryEmbeddingCache instead.
+        """
+        if not cache:
+            return self._embed_text(texts)
+        return self._cached(
+            self.text_key,
+            [text.encode("utf-8") for text in texts],
+            lambda indices: self._embed_text([texts[i] for i in indices]),
+        )
+
+    def _embed_text(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        encodings = self.text_tokenizer(texts, truncation=True, max_length=512)
+        if self.backend == "onnx":
+            return self._embed_text_onnx(encodings, len(texts))
+        embeddings = np.empty((len(texts), self.text_model.config.hidden_size), dtype=np.float32)
+
+        for bucket in self._length_buckets(encodings):
+            inputs = self._pad_bucket(self.text_tokenizer, encodings, bucket)
+            with torch.no_grad():
+                hidden = self.text_model(**inputs).last_hidden_state
+                # Mean pooling over real tokens only, so an embedding does not
+                # depend on how much padding its batch needed
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                batch_emb = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                batch_emb = batch_emb / batch_emb.norm(p=2, dim=-1, keepdim=True)
+            embeddings[bucket] = batch_emb.cpu().numpy()
+
+        return embeddings.tolist()
+
+    def _embed_text_onnx(self, encodings, n_texts: int) -> List[List[float]]:
+        embeddings = None
+        for bucket in self._length_buckets(encodings):
+            inputs = self._pad_bucket(self.text_tokenizer, encodings, bucket)
+            hidden = self.onnx_text(inputs)
+            # Same masked mean pooling as the torch path
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            batch_emb = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+            if embeddings is None:
+                embeddings = np.empty((n_texts, batch_emb.shape[1]), dtype=np.float32)
+            embeddings[bucket] = self._normalize(batch_emb)
+        return embeddings.tolist()
+
+    def embed_text_using_clip(self, texts: List[str], cache: bool = True) -> List[List[float]]:
+        """Embed text using CLIP (for cross-modal text <-> image retrieval); `cache` as in embed_text()."""
+        if not cache:
+            return self._embed_text_using_clip(texts)
+        return self._cached(
+            self.clip_text_key,
+            [text.encode("utf-8") for text in texts],
+            lambda indices: self._embed_text_using_clip([texts[i] for i in indices]),
+        )
+
+    def _embed_text_using_clip(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        tokenizer = self.clip_processor.tokenizer
+        encodings = tokenizer(texts, truncation=True, max_length=tokenizer.model_max_length)
+        if self.backend == "onnx":
+            embeddings = None
+            for bucket in self._length_buckets(encodings):
+                batch_emb = self.onnx_clip_text(self._pad_bucket(tokenizer, encodings, bucket))
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), batch_emb.shape[1]), dtype=np.float32)
+                embeddings[bucket] = self._normalize(batch_emb)
+            return embeddings.tolist()
+        embeddings = np.empty((len(texts), self.clip_model.config.projection_dim), dtype=np.float32)
+
+        for bucket in self._length_buckets(encodings):
+            inputs = self._pad_bucket(tokenizer, encodings, bucket)
+            with torch.no_grad():
+                batch_emb = self.clip_model.get_text_features(**inputs)
+                batch_emb = batch_emb / batch_emb.norm(p=2, dim=-1, keepdim=True)
+            embeddings[bucket] = batch_emb.cpu().numpy()
+
+        return embeddings.tolist()
 
     def embed_images(self, image_paths: List[str]) -> List[List[float]]:
         """Embed images using CLIP."""
-        imgs = [Image.open(path).convert("RGB") for path in image_paths]
-        images = [img.resize((224, 224)) for img in imgs]
+        return list(self.embed_images_stream(image_paths))
+
+    def embed_images_stream(
+        self,
+        image_paths: Iterable[str],
+        batch_size: Optional[int] = None,
+        max_workers: int = 4
+    ) -> Iterator[List[float]]:
+        """
+        Embed images using CLIP, yielding one embedding per path, in order.
+
+        Paths are taken `batch_size` at a time (default: the embedder's
+        batch_size, else 16); each batch is read and decoded on a thread pool
+        and run through CLIP before the next one is read, so memory is bounded
+        by the batch, not by the number of figures.
+        """
+        batch_size = batch_size or self.batch_size or 16
+        paths = iter(image_paths)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-decode") as pool:
+            while True:
+                batch = list(islice(paths, batch_size))
+                if not batch:
+                    return
+
+                def compute(indices: List[int]) -> List[List[float]]:
+                    return self._embed_image_batch(list(pool.map(self._load_image, [batch[i] for i in indices])))
+
+                if self.cache is None:
+                    yield from compute(list(range(len(batch))))
+                else:
+                    contents = list(pool.map(self._read_bytes, batch))
+                    yield from self._cached(self.clip_image_key, contents, compute)
+
+    @staticmethod
+    def _read_bytes(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _load_image(path: str) -> Image.Image:
+        with Image.open(path) as img:
+            return img.convert("RGB").resize((224, 224))
+
+    def _embed_image_batch(self, images: List[Image.Image]) -> List[List[float]]:
+        if not images:
+            return []
+        if self.backend == "onnx":
+            inputs = self.clip_processor(images=images, return_tensors="np")
+            return self._normalize(self.onnx_clip_vision(inputs)).tolist()
         inputs = self.clip_processor(images=images, return_tensors="pt").to(self.device)
 
         with torch.no_grad():
@@ -310,6 +632,32 @@ class MultimodalEmbedder:
 
 
 
+_shared_embedders: Dict[Tuple[str, bool, bool], MultimodalEmbedder] = {}
+_shared_embedders_lock = threading.Lock()
+
+
+def get_embedder(backend: str = DEFAULT_EMBEDDING_BACKEND, quantize: bool = True, use_cache: bool = True) -> MultimodalEmbedder:
+    """
+    Process-wide shared MultimodalEmbedder, one per configuration.
+
+    Constructing it is cheap (towers load on first use), so the indexing job,
+    the API routes and every RAG request share the same loaded models instead
+    of each loading their own. With `use_cache` it embeds through the
+    persistent EmbeddingCache.
+    """
+    key = (backend, quantize, use_cache)
+    with _shared_embedders_lock:
+        embedder = _shared_embedders.get(key)
+        if embedder is None:
+            embedder = MultimodalEmbedder(
+                cache=EmbeddingCache() if use_cache else None,
+                backend=backend,
+                quantize=quantize,
+            )
+            _shared_embedders[key] = embedder
+        return embedder
+
+
 # ==============
 # test embedding 
 # ==============
@@ -350,36 +698,21 @@ def get_paper_embedding(
     index_path: str = "faiss_index/faiss_index",
     model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
 ) -> np.ndarray:
-    """Fixed: Added proper error handling and type hints"""
+    """
+    Stored abstract embedding of a paper (the vector PaperVectorStore wrote
+    with `model_name`), looked up by paper_id without loading the model.
+    """
     try:
-        # Load embeddings model
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-        # Check if FAISS index directory exists
-        if not os.path.exists(index_path):
-            raise FileNotFoundError(f"FAISS index directory not found at {index_path}")
-        
-        # Check if the actual index file exists
-        index_file = os.path.join(index_path, "index.faiss")
-        if not os.path.exists(index_file):
-            raise FileNotFoundError(f"FAISS index file not found at {index_file}")
-
-        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-
-        docs = vectorstore.similarity_search("", k=10000)  # Get all docs - might need optimization
-        
-        for doc in docs:
-            if doc.metadata.get('id') == paper_id:
-                # Get the embedding for this document's content
-                embedding_vector = embeddings.embed_query(doc.page_content)
-                return np.array(embedding_vector, dtype=np.float32)
-        
-        raise ValueError(f"Paper with ID {paper_id} not found in FAISS index.")
-    
+        return get_paper_lookup(index_path).get(paper_id)
     except Exception as e:
         logging.error(f"Error getting paper embedding for {paper_id}: {str(e)}")
         raise
 
+
+def get_paper_embeddings(paper_ids: List[str], index_path: str = "faiss_index/faiss_index") -> Dict[str, np.ndarray]:
+    """Batch variant of get_paper_embedding: {paper_id: vector} for the ids found in the store."""
+    return get_paper_lookup(index_path).get_many(paper_ids)
+
 def handle_paper_interaction(user_id: str, paper: Dict[str, str], interaction_type: str):
     """Fixed: Better error handling and validation"""
     try:
@@ -423,13 +756,47 @@ def handle_paper_interaction(user_id: str, paper: Dict[str, str], interaction_ty
                 interaction_types=[interaction]
             )
             update_user_embedding(db , user_id=user_id , new_paper_embedding=new_embedding)
+            # Re-rank the materialized feed only if the embedding drifted enough
+            from backend.app.services.feed_service import refresh_user_feed
+            refresh_user_feed(db, user_id)
             
     except Exception as e:
         logging.error(f"Error handling paper interaction: {str(e)}")
         raise
 
-def get_paper_recommendations(user_id: str, candidate_papers: List[Dict]) -> List[Dict]:
-    """Fixed: Better error handling and validation"""
+def discover_papers(user_id: str, top_k: int = 20, exclude_seen: bool = True,
+                    index_path: str = "faiss_index/faiss_index") -> List[Dict]:
+    """
+    Discover mode: nearest papers to the user's embedding across the whole
+    abstract store (ANN search), skipping papers the user has already seen.
+    """
+    try:
+        if not user_id:
+            return []
+
+        with get_db() as db:
+            row = get_embedding(db, user_id)
+            # No embedding yet means no signal to search with
+            if row is None or not row.embedding:
+                return []
+            user_embedding = np.asarray(row.embedding, dtype=np.float32)
+            seen = get_seen_paper_ids(db, user_id) if exclude_seen else set()
+
+        hits = get_paper_lookup(index_path).search(user_embedding, top_k=top_k, exclude=seen)
+        return [{'id': paper_id, 'relevance_score': (cosine + 1) / 2} for paper_id, cosine in hits]
+
+    except Exception as e:
+        logging.error(f"Error discovering papers for user {user_id}: {str(e)}")
+        return []
+
+
+def get_paper_recommendations(user_id: str, candidate_papers: List[Dict], top_k: Optional[int] = None) -> List[Dict]:
+    """
+    Rank candidate papers by relevance to the user's embedding.
+
+    All candidate vectors are fetched in one lookup and scored in one
+    matmul; only the `top_k` best (all if None) are sorted and returned.
+    """
     try:
         if not user_id or not candidate_papers:
             return []
@@ -439,29 +806,26 @@ def get_paper_recommendations(user_id: str, candidate_papers: List[Dict]) -> Lis
                 db, user_id, "sentence-transformers/all-MiniLM-L6-v2" 
             )
             
-            scored_papers = []
-            for paper in candidate_papers:
-                try:
-                    if 'id' not in paper:
-                        logging.warning(f"Paper missing ID: {paper}")
-                        continue
-                        
-                    paper_embedding = get_paper_embedding(paper['id'])
-                    relevance_score = embedding_service.get_paper_relevance_score(
-                        user_embedding, paper_embedding
-                    )
-                    
-                    scored_papers.append({
-                        **paper,
-                        'relevance_score': float(relevance_score) 
-                    })
-                    
-                except Exception as e:
-                    logging.error(f"Error scoring paper {paper.get('id', 'unknown')}: {str(e)}")
-                    continue
-            
-            # Fixed: Sort by relevance score (descending)
-            return sorted(scored_papers, key=lambda x: x['relevance_score'], reverse=True)
+        papers = []
+        for paper in candidate_papers:
+            if 'id' not in paper:
+                logging.warning(f"Paper missing ID: {paper}")
+                continue
+            papers.append(paper)
+
+        embeddings = get_paper_embeddings([paper['id'] for paper in papers])
+        missing = [paper['id'] for paper in papers if paper['id'] not in embeddings]
+        if missing:
+            logging.error(f"Error scoring {len(missing)} papers not found in FAISS index: {missing[:10]}")
+        papers = [paper for paper in papers if paper['id'] in embeddings]
+        if not papers:
+            return []
+
+        paper_matrix = np.stack([embeddings[paper['id']] for paper in papers])
+        scores = embedding_service.get_paper_relevance_scores(user_embedding, paper_matrix)
+        order = embedding_service.top_k_indices(scores, top_k)
+
+        return [{**papers[i], 'relevance_score': float(scores[i])} for i in order]
     
     except Exception as e:
         logging.error(f"Error getting paper recommendations for user {user_id}: {str(e)}")
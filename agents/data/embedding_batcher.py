@@ -0,0 +1,144 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
+
+from agents.data.embedding import MultimodalEmbedder, get_embedder
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic batching in front of a MultimodalEmbedder.
+
+    Concurrent requests (typically one query each) are put on a queue; a
+    single worker thread takes the first waiting request, keeps collecting
+    for at most `max_wait_ms` or until `max_batch_size` texts, and runs the
+    whole group as one forward pass per encoder. Each caller gets a Future
+    for its own slice of the result.
+
+    embed_text() / embed_text_using_clip() block on that future, so the
+    batcher can stand in for the embedder on the query path. Queries bypass
+    the persistent EmbeddingCache, which only holds document chunks; wrap
+    the batcher in QueryEmbeddingCache to cache them.
+    """
+
+    METHODS = ("embed_text", "embed_text_using_clip")
+
+    def __init__(self, embedder: MultimodalEmbedder, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue[Optional[Tuple[str, List[str], Future]]]" = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, texts: List[str], method: str = "embed_text") -> Future:
+        """Queue texts for `method`; the future resolves to their embeddings, in order."""
+        if method not in self.METHODS:
+            raise ValueError(f"method must be one of {self.METHODS}, got {method!r}")
+        if self._closed:
+            raise RuntimeError("EmbeddingBatcher is closed")
+
+        future: Future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result([])
+        else:
+            self._queue.put((method, texts, future))
+        return future
+
+    def embed_text(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts, "embed_text").result()
+
+    def embed_text_using_clip(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts, "embed_text_using_clip").result()
+
+    def _collect(self) -> List[Tuple[str, List[str], Future]]:
+        """Block for one request, then gather more until the window closes or the batch is full."""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch, size = [first], len(first[1])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutting down: serve what was collected, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            by_method: Dict[str, List[Tuple[List[str], Future]]] = {}
+            for method, texts, future in batch:
+                # Skip requests whose caller cancelled while queued
+                if future.set_running_or_notify_cancel():
+                    by_method.setdefault(method, []).append((texts, future))
+
+            for method, requests in by_method.items():
+                texts = [text for request_texts, _ in requests for text in request_texts]
+                try:
+                    embeddings = getattr(self.embedder, method)(texts, cache=False)
+                except Exception as e:
+                    logger.error(f"Batched {method} of {len(texts)} texts failed: {e}")
+                    for _, future in requests:
+                        future.set_exception(e)
+                    continue
+
+                start = 0
+                for request_texts, future in requests:
+                    future.set_result(embeddings[start:start + len(request_texts)])
+                    start += len(request_texts)
+                self.batches += 1
+                self.items += len(texts)
+
+    def close(self):
+        """Finish the queued requests and stop the worker."""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+_shared_batcher: Optional[EmbeddingBatcher] = None
+_shared_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Process-wide EmbeddingBatcher over the shared embedder (see get_embedder)."""
+    global _shared_batcher
+    with _shared_batcher_lock:
+        if _shared_batcher is None:
+            _shared_batcher = EmbeddingBatcher(get_embedder())
+        return _shared_batcher
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Callable, Tuple
+
+import numpy as np
+
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "storage/embedding_cache.sqlite")
+
+
+def content_key(data: bytes) -> str:
+    """Content address of a chunk text / image file: sha256 of its bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache (SQLite).
+
+    Entries are keyed by (model name, sha256 of the input bytes), so the same
+    chunk text or figure is only embedded once per model, whichever paper or
+    run it comes from. Vectors are stored as raw float32 blobs.
+
+    The file is bounded to `max_bytes` of vector data: when it grows past
+    that, least recently used entries (reads refresh `last_used`) are evicted
+    down to 90% of the bound. Hit / miss counters are kept per process.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets the crawler and the API processes share the file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Return {key: vector} for the keys that are cached, and refresh their LRU position."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # Stay under SQLite's default limit of 999 bound parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND key IN ({','.join('?' * len(rows))})",
+                        [time.time(), model, *[key for key, _ in rows]],
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """Store {key: vector} entries, then evict LRU entries if over the size bound."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((model, key, blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._total_bytes += sum(row[3] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries down to 90% of max_bytes."""
+        # Other processes write the same file: start from the real size
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        excess = self._total_bytes - int(self.max_bytes * 0.9)
+        if excess <= 0:
+            return
+
+        victims, freed = [], 0
+        for rowid, nbytes in self._conn.execute("SELECT rowid, nbytes FROM embeddings ORDER BY last_used"):
+            victims.append((rowid,))
+            freed += nbytes
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+        self._conn.commit()
+        self._total_bytes -= freed
+        self.evictions += len(victims)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a user question (both encoders lowercase anyway)."""
+    return " ".join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU + TTL cache of query embeddings for the retrieval path.
+
+    Keyed by (model, normalized query), so the BGE and the CLIP vector of a
+    question are cached side by side and templated questions ("What is the
+    methodology?") skip both encoders. Entries expire after `ttl_seconds`;
+    beyond `max_entries` the least recently used entry is dropped.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, model: str, queries: List[str], encode: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Return one embedding per query, running `encode` once on the misses."""
+        keys = [(model, normalize_query(query)) for query in queries]
+        now = time.monotonic()
+        vectors: Dict[Tuple[str, str], List[float]] = {}
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    vectors[key] = entry[1]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if missing:
+            computed = encode([query for _, query in missing])
+            with self._lock:
+                for key, vector in zip(missing, computed):
+                    vectors[key] = vector
+                    self._entries[key] = (now, vector)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return [vectors[key] for key in keys]
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every retriever in the process
+query_embedding_cache = QueryEmbeddingCache()
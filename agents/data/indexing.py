@@ -1,9 +1,22 @@
+import datetime
 import faiss
 import numpy as np
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple, Union, Iterable
 from collections import defaultdict
+from contextlib import contextmanager
+from agents.data.metadata_store import MetadataStore
+
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+STORAGE_TYPES = ("float32", "sq8", "fp16", "pq")
+SQ_TYPES = {"sq8": faiss.ScalarQuantizer.QT_8bit, "fp16": faiss.ScalarQuantizer.QT_fp16}
+# Filtered searches matching at most this many rows are scored exactly
+EXACT_FILTER_ROWS = 4096
+# Attempts of load() when a concurrent compaction replaces the files it is reading
+LOAD_RETRIES = 3
 
 
 class FAISSIndex:
@@ -11,22 +24,307 @@ class FAISSIndex:
     Wrapper around FAISS index for text + image embeddings,
     with support for storing and retrieving by paper_id.
     Supports multiple chunks (text + images) per paper.
+
+    `index_type` ("flat", "hnsw", "ivf") and `storage` ("float32", "sq8",
+    "fp16", "pq") pick the FAISS structure; `rerank=True` keeps an exact copy
+    to re-score compressed results. `save()` appends small segments that are
+    compacted into a new base generation in the background (see `compact()`),
+    and `remove_paper()` tombstones rows until then.
     """
     
-    def __init__(self, dim: int, index_path: str = "faiss_index/index_rag.faiss"):
+    def __init__(
+        self,
+        dim: int,
+        index_path: str = "faiss_index/index_rag.faiss",
+        index_type: str = "flat",
+        hnsw_m: int = 32,
+        ef_construction: int = 40,
+        ef_search: int = 64,
+        nlist: int = 100,
+        nprobe: int = 8,
+        storage: str = "float32",
+        pq_m: Optional[int] = None,
+        rerank: bool = False,
+        rerank_factor: int = 4,
+        train_size: Optional[int] = None,
+        max_segments: int = 8,
+        max_deleted_fraction: float = 0.2,
+        background_compaction: bool = True
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index_type '{index_type}', expected one of {INDEX_TYPES}")
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage '{storage}', expected one of {STORAGE_TYPES}")
+        pq_m = pq_m if pq_m is not None else dim // 8
+        if storage == "pq" and (pq_m <= 0 or dim % pq_m != 0):
+            raise ValueError(f"pq_m={pq_m} must divide the dimension {dim}")
+
         self.dim = dim
         self.index_path = index_path
+        self.metadata_prefix = index_path.replace('.faiss', '_meta')
+        # Legacy JSON sidecar, still read if no MetadataStore exists yet
         self.metadata_path = index_path.replace('.faiss', '_metadata.json')
-        self.index = faiss.IndexFlatL2(dim)
-        self.metadata: List[Dict[str, Any]] = []
+        self.config_path = index_path.replace('.faiss', '_config.json')
+        self.manifest_path = index_path.replace('.faiss', '_manifest.json')
+        self.vectors_path = index_path.replace('.faiss', '_vectors.npy')
+        self.index_config: Dict[str, Any] = {
+            "index_type": index_type,
+            "hnsw_m": hnsw_m,
+            "ef_construction": ef_construction,
+            "ef_search": ef_search,
+            "nlist": nlist,
+            "nprobe": nprobe,
+            "storage": storage,
+            "pq_m": pq_m,
+            "rerank": rerank,
+            "rerank_factor": rerank_factor,
+        }
+        self.index_config["train_size"] = train_size if train_size is not None else self._default_train_size()
+        self.index = self._build_index()
+        self.metadata = MetadataStore()
         # Changed: now maps paper_id to list of indices
         self.id_to_indices: Dict[str, List[int]] = defaultdict(list)
+        # paper_id -> cached vector block for restricted search
+        self._paper_blocks: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+
+        # Deletion state: removed rows stay in the FAISS index (excluded from
+        # search through an ID selector) until the next compaction drops them
+        self._deleted_rows: Set[int] = set()
+        self._unsaved_deletions: List[int] = []
+        self._live_rows: Optional[np.ndarray] = None
+        self._next_id = 0
+        # (attribute, value) -> boolean row mask for filtered search
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+
+        # Segment persistence state
+        self.max_segments = max_segments
+        self.max_deleted_fraction = max_deleted_fraction
+        self.background_compaction = background_compaction
+        self.manifest: Dict[str, Any] = self._empty_manifest()
+        self._persisted_rows = 0
+        self._unflushed_vectors: List[np.ndarray] = []
+        # Exact float32 copy for re-ranking: memory-mapped base rows, then the
+        # vectors of live segments (kept only when rerank is enabled)
+        self._base_vectors: Optional[np.ndarray] = None
+        self._segment_vectors: List[np.ndarray] = []
+        self._exact_tail: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+        # Serializes compactions; taken before `_lock`, never while holding it
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        # Searches (shared) vs. swapping index / metadata (exclusive)
+        self._state_changed = threading.Condition()
+        self._readers = 0
+        self._swap_pending = False
+
+        # Read-only (mmap) mode: the base index cannot be modified, so
+        # segment vectors go to a private tail index searched alongside it
+        self.read_only = False
+        self._tail_index: Optional[faiss.Index] = None
 
         os.makedirs(os.path.dirname(index_path), exist_ok=True)
+
+    @classmethod
+    def open(cls, dim: int, index_path: str, read_only: bool = False, **kwargs) -> "FAISSIndex":
+        """Create an index and load it from disk if it was saved before."""
+        index = cls(dim=dim, index_path=index_path, **kwargs)
+        if cls.exists(index_path):
+            index.load(read_only=read_only)
+        return index
+
+    @staticmethod
+    def exists(index_path: str) -> bool:
+        """True if an index was saved at `index_path` (manifest, or a base from before manifests)."""
+        return os.path.exists(index_path) or os.path.exists(index_path.replace('.faiss', '_manifest.json'))
+
+    # ======================
+    # Index construction
+    # ======================
+    @property
+    def index_type(self) -> str:
+        return self.index_config["index_type"]
+
+    @property
+    def ntotal(self) -> int:
+        """Number of stored rows across the base index and the read-only tail, deleted rows included."""
+        tail = self._tail_index.ntotal if self._tail_index is not None else 0
+        return self.index.ntotal + tail
+
+    def _live_mask(self) -> Optional[np.ndarray]:
+        """Boolean mask of the rows that are not deleted, or None when nothing is deleted."""
+        if not self._deleted_rows:
+            return None
+        if self._live_rows is None or len(self._live_rows) != self.ntotal:
+            live = np.ones(self.ntotal, dtype=bool)
+            live[np.fromiter(self._deleted_rows, dtype=np.int64)] = False
+            self._live_rows = live
+        return self._live_rows
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Index {self.index_path} was loaded read-only")
+
+    @contextmanager
+    def _reading(self):
+        """Shared section for searches: the index / metadata they read are not swapped meanwhile."""
+        with self._state_changed:
+            while self._swap_pending:
+                self._state_changed.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._state_changed:
+                self._readers -= 1
+                self._state_changed.notify_all()
+
+    @contextmanager
+    def _swapping(self):
+        """Exclusive section for replacing the index / metadata / exact copy (waits for running searches)."""
+        with self._state_changed:
+            while self._swap_pending:
+                self._state_changed.wait()
+            self._swap_pending = True
+            while self._readers:
+                self._state_changed.wait()
+        try:
+            yield
+        finally:
+            with self._state_changed:
+                self._swap_pending = False
+                self._state_changed.notify_all()
+
+    @property
+    def is_trained(self) -> bool:
+        """False while vectors are still staged in the flat buffer awaiting training."""
+        if not self._needs_training():
+            return True
+        return not isinstance(faiss.downcast_index(self.index), faiss.IndexFlat)
+
+    def _needs_training(self) -> bool:
+        return self.index_type == "ivf" or self.index_config["storage"] in ("sq8", "pq")
+
+    def _min_train_size(self) -> int:
+        sizes = [1]
+        if self.index_type == "ivf":
+            sizes.append(self.index_config["nlist"])
+        if self.index_config["storage"] == "pq":
+            sizes.append(256)  # one k-means centroid per 8-bit code
+        return max(sizes)
+
+    def _default_train_size(self) -> int:
+        # FAISS recommends ~39 training points per k-means centroid
+        sizes = [1000 if self.index_config["storage"] == "sq8" else 0]
+        if self.index_type == "ivf":
+            sizes.append(self.index_config["nlist"] * 39)
+        if self.index_config["storage"] == "pq":
+            sizes.append(256 * 39)
+        return max(sizes)
+
+    def _build_index(self) -> faiss.Index:
+        """Create an empty FAISS index matching `index_config` (a flat staging buffer if it needs training)."""
+        if self._needs_training():
+            index = faiss.IndexFlatL2(self.dim)
+        else:
+            index = self._build_target_index()
+        self._apply_search_params(index)
+        return index
+
+    def _build_target_index(self) -> faiss.Index:
+        """Create the configured (possibly untrained) FAISS index."""
+        cfg = self.index_config
+        storage = cfg["storage"]
+
+        if self.index_type == "hnsw":
+            if storage == "float32":
+                index = faiss.IndexHNSWFlat(self.dim, cfg["hnsw_m"])
+            elif storage == "pq":
+                index = faiss.IndexHNSWPQ(self.dim, cfg["pq_m"], cfg["hnsw_m"])
+            else:
+                index = faiss.IndexHNSWSQ(self.dim, SQ_TYPES[storage], cfg["hnsw_m"])
+            index.hnsw.efConstruction = cfg["ef_construction"]
+        elif self.index_type == "ivf":
+            quantizer = faiss.IndexFlatL2(self.dim)
+            if storage == "float32":
+                index = faiss.IndexIVFFlat(quantizer, self.dim, cfg["nlist"], faiss.METRIC_L2)
+            elif storage == "pq":
+                index = faiss.IndexIVFPQ(quantizer, self.dim, cfg["nlist"], cfg["pq_m"], 8)
+            else:
+                index = faiss.IndexIVFScalarQuantizer(quantizer, self.dim, cfg["nlist"], SQ_TYPES[storage])
+        else:
+            if storage == "float32":
+                index = faiss.IndexFlatL2(self.dim)
+            elif storage == "pq":
+                index = faiss.IndexPQ(self.dim, cfg["pq_m"], 8)
+            else:
+                index = faiss.IndexScalarQuantizer(self.dim, SQ_TYPES[storage])
+        return index
+
+    def _build_trained_index(self, train_vectors: np.ndarray) -> faiss.Index:
+        """Train a fresh target index on `train_vectors`."""
+        min_size = self._min_train_size()
+        if len(train_vectors) < min_size:
+            raise ValueError(f"Training needs at least {min_size} vectors, got {len(train_vectors)}")
+
+        index = self._build_target_index()
+        index.train(train_vectors)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # Keep a direct map so per-paper search can reconstruct stored vectors
+            ivf.make_direct_map()
+        self._apply_search_params(index)
+        return index
+
+    def _apply_search_params(self, index: Optional[faiss.Index] = None):
+        """Push the runtime search knobs (efSearch / nprobe) into the FAISS index."""
+        index = index if index is not None else self.index
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.index_config["nprobe"], ivf.nlist)
+            return
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.index_config["ef_search"]
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+        """Tune the recall / latency trade-off of HNSW (efSearch) or IVF (nprobe)."""
+        if ef_search is not None:
+            self.index_config["ef_search"] = ef_search
+        if nprobe is not None:
+            self.index_config["nprobe"] = nprobe
+        self._apply_search_params()
+
+    def train(self, train_vectors: Optional[np.ndarray] = None):
+        """
+        Train the configured index (IVF / sq8 / pq) and move the staged vectors into it.
+
+        Args:
+            train_vectors: Optional training sample; defaults to the staged vectors.
+        """
+        if self.is_trained:
+            return
+        self._check_writable()
+
+        staged = self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else np.empty((0, self.dim), dtype=np.float32)
+        sample = staged if train_vectors is None else np.asarray(train_vectors, dtype=np.float32)
+
+        index = self._build_trained_index(sample)
+        if len(staged):
+            index.add(staged)
+        self.index = index
+
+    def _maybe_train(self):
+        if not self.is_trained and self.index.ntotal >= max(self.index_config["train_size"], self._min_train_size()):
+            self.train()
     
     def add_embeddings(self, embeddings, metadatas: List[Dict[str, Any]]):
-        """Add embeddings and their metadata (must include 'paper_id' and 'chunk_type')."""
-        if not embeddings:
+        """
+        Add embeddings and their metadata (must include 'paper_id' and 'chunk_type').
+
+        Every vector gets a new stable 64-bit 'vector_id' (returned in its
+        metadata); ids are never reused, even after the vector is removed.
+        """
+        if len(embeddings) == 0:
             return
             
         if len(embeddings) != len(metadatas):
@@ -41,9 +339,25 @@ class FAISSIndex:
             if "chunk_type" not in meta:
                 raise ValueError(f"Metadata {i} must include a 'chunk_type' (e.g., 'text', 'image')")
         
+        self._check_writable()
         np_embs = np.array(embeddings, dtype=np.float32)
-        start_idx = self.index.ntotal
-        self.index.add(np_embs)
+        with self._lock, self._swapping():
+            metadatas = [{**meta, "vector_id": self._next_id + i} for i, meta in enumerate(metadatas)]
+            self._next_id += len(metadatas)
+            self._add(np_embs, metadatas)
+            self._unflushed_vectors.append(np_embs)
+            self._exact_tail = None
+
+    def _add(self, np_embs: np.ndarray, metadatas: List[Dict[str, Any]]):
+        """Append vectors + metadata (already carrying their 'vector_id') as new rows."""
+        start_idx = self.ntotal
+        if self.read_only:
+            if self._tail_index is None:
+                self._tail_index = faiss.IndexFlatL2(self.dim)
+            self._tail_index.add(np_embs)
+        else:
+            self.index.add(np_embs)
+            self._maybe_train()
 
         # Add to metadata and update id_to_indices mapping
         for i, meta in enumerate(metadatas):
@@ -52,13 +366,101 @@ class FAISSIndex:
             
             self.metadata.append(meta)
             self.id_to_indices[paper_id].append(current_idx)
+            self._paper_blocks.pop(paper_id, None)
+
+    def remove_paper(self, paper_id: str) -> int:
+        """
+        Remove all chunks of a paper. Returns the number of vectors removed.
+
+        The rows disappear from search results, get_by_paper_id() and the
+        stats immediately; the next save() records the deletion and a later
+        compaction reclaims the space.
+        """
+        self._check_writable()
+        with self._lock, self._swapping():
+            rows = self.id_to_indices.pop(paper_id, [])
+            self._tombstone(paper_id, rows)
+            return len(rows)
+
+    def _tombstone(self, paper_id: str, rows: List[int]):
+        """Mark rows of one paper as deleted (caller holds the lock and the swapping section)."""
+        if not rows:
+            return
+        self._deleted_rows.update(rows)
+        self._unsaved_deletions.extend(self.metadata.column("vector_id")[rows].tolist())
+        self._live_rows = None
+        self._paper_blocks.pop(paper_id, None)
+
+    def _remove_vector_ids(self, paper_id: str, vector_ids: List[int]):
+        """Tombstone the rows of `paper_id` that carry the given vector ids."""
+        with self._lock, self._swapping():
+            rows = self.metadata.rows_for_ids(vector_ids)
+            removed = set(rows[rows >= 0].tolist()) - self._deleted_rows
+            remaining = [row for row in self.id_to_indices.get(paper_id, []) if row not in removed]
+            if remaining:
+                self.id_to_indices[paper_id] = remaining
+            else:
+                self.id_to_indices.pop(paper_id, None)
+            self._tombstone(paper_id, sorted(removed))
+
+    def replace_paper(self, paper_id: str, batches: Iterable[Tuple[Any, List[Dict[str, Any]]]]) -> int:
+        """
+        Replace all chunks of a paper with streamed (embeddings, metadatas) batches.
+
+        The new chunks are added first and the old ones are only removed once
+        the last batch is in, so if producing a batch fails (e.g. embedding)
+        the paper keeps its previous chunks. Returns the number of vectors added.
+        """
+        self._check_writable()
+        with self._lock:
+            old_ids = self.metadata.column("vector_id")[self.id_to_indices.get(paper_id, [])].tolist()
+        new_ids: List[int] = []
+        try:
+            for embeddings, metadatas in batches:
+                with self._lock:
+                    first_id = self._next_id
+                    self.add_embeddings(embeddings, [{**meta, "paper_id": paper_id} for meta in metadatas])
+                    new_ids.extend(range(first_id, self._next_id))
+        except BaseException:
+            self._remove_vector_ids(paper_id, new_ids)
+            raise
+        self._remove_vector_ids(paper_id, old_ids)
+        return len(new_ids)
+
+    def upsert_paper(self, paper_id: str, embeddings, metadatas: List[Dict[str, Any]]) -> bool:
+        """
+        Replace all chunks of a paper with the given embeddings + metadata.
+
+        Re-indexing a paper is idempotent: if the paper is already stored
+        with exactly the same chunk metadata, nothing changes and its vector
+        ids are kept. Returns True if the index was modified.
+        """
+        metadatas = [{**meta, "paper_id": paper_id} for meta in metadatas]
+        with self._lock:
+            stored = [
+                {k: v for k, v in self.metadata[idx].items() if k != "vector_id"}
+                for idx in self.id_to_indices.get(paper_id, [])
+            ]
+            if stored and len(stored) == len(metadatas) == len(embeddings):
+                # Compare what the store would keep (None attributes dropped, JSON payload)
+                incoming = [
+                    {k: v for k, v in meta.items() if k != "vector_id"}
+                    for meta in MetadataStore.from_records(metadatas)
+                ]
+                if incoming == stored:
+                    return False
+
+            self.remove_paper(paper_id)
+            self.add_embeddings(embeddings, metadatas)
+            return True
     
     def search(
         self, 
         query_emb: List[float], 
         top_k: int = 5, 
         paper_id: Optional[str] = None,
-        chunk_type: Optional[str] = None
+        chunk_type: Optional[str] = None,
+        **filters
     ) -> List[Dict[str, Any]]:
         """
         Search for similar embeddings.
@@ -68,70 +470,386 @@ class FAISSIndex:
             top_k: Number of results to return
             paper_id: If provided, restrict search to this paper's chunks
             chunk_type: If provided, restrict to specific chunk type ('text', 'image', etc.)
+            **filters: categories / published_after / published_before /
+                allowed_papers, see search_batch()
         """
         if len(query_emb) != self.dim:
             raise ValueError(f"Query embedding has dimension {len(query_emb)}, expected {self.dim}")
-        
-        if self.index.ntotal == 0:
-            return []
-        
-        np_query = np.array([query_emb], dtype=np.float32)
 
-        if paper_id is None:
-            # === Global search ===
-            search_k = min(top_k * 2, self.index.ntotal)  # Get more to filter by chunk_type
-            distances, indices = self.index.search(np_query, search_k)
-            
-            results = []
-            for i, idx in enumerate(indices[0]):
-                if idx != -1 and idx < len(self.metadata):
-                    meta = self.metadata[idx]
-                    
-                    # Filter by chunk_type if specified
-                    if chunk_type and meta.get("chunk_type") != chunk_type:
-                        continue
-                        
-                    result = meta.copy()
-                    result["score"] = float(distances[0][i])
-                    results.append(result)
-                    
-                    if len(results) >= top_k:
-                        break
+        return self.search_batch([query_emb], top_k, paper_ids=paper_id, chunk_types=chunk_type, **filters)[0]
+
+    def search_batch(
+        self,
+        query_embs,
+        top_k: int = 5,
+        paper_ids: Union[None, str, List[Optional[str]]] = None,
+        chunk_types: Union[None, str, List[Optional[str]]] = None,
+        categories: Optional[Iterable[str]] = None,
+        published_after: Union[None, str, datetime.date] = None,
+        published_before: Union[None, str, datetime.date] = None,
+        allowed_papers: Optional[Iterable[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search many queries at once.
+
+        All global queries with the same chunk_type go through a single FAISS
+        search call, and all queries restricted to the same paper share one
+        matrix product against that paper's vector block.
+
+        Filters are turned into a bitmap over rows and pushed into the FAISS
+        search as an ID selector, so a filtered query still returns a full
+        top-k (as long as that many rows match).
+
+        Args:
+            query_embs: (nq, dim) matrix of query embeddings
+            top_k: Number of results to return per query
+            paper_ids: One paper_id (or None) for all queries, or one per query
+            chunk_types: One chunk_type (or None) for all queries, or one per query
+            categories: Only papers with any of these categories
+            published_after: Only papers published on or after this date
+            published_before: Only papers published on or before this date
+            allowed_papers: Only these papers (e.g. a user's library)
+
+        Returns:
+            One result list per query, in query order.
+        """
+        np_queries = np.atleast_2d(np.asarray(query_embs, dtype=np.float32))
+        if np_queries.shape[1] != self.dim:
+            raise ValueError(f"Query embeddings have dimension {np_queries.shape[1]}, expected {self.dim}")
+
+        nq = len(np_queries)
+        paper_ids = self._per_query(paper_ids, nq, "paper_ids")
+        chunk_types = self._per_query(chunk_types, nq, "chunk_types")
+        with self._reading():
+            return self._search_batch(np_queries, top_k, paper_ids, chunk_types, categories,
+                                      published_after, published_before, allowed_papers)
+
+    def _search_batch(
+        self,
+        np_queries: np.ndarray,
+        top_k: int,
+        paper_ids: List[Optional[str]],
+        chunk_types: List[Optional[str]],
+        categories: Optional[Iterable[str]],
+        published_after: Union[None, str, datetime.date],
+        published_before: Union[None, str, datetime.date],
+        allowed_papers: Optional[Iterable[str]]
+    ) -> List[List[Dict[str, Any]]]:
+        nq = len(np_queries)
+        results: List[List[Dict[str, Any]]] = [[] for _ in range(nq)]
+
+        if self.ntotal == 0:
             return results
-        
-        else:
-            # === Restricted search (only within one paper) ===
-            if paper_id not in self.id_to_indices:
-                return []
-                
-            candidate_indices = self.id_to_indices[paper_id]
-            
-            # Filter by chunk_type if specified
+
+        allowed = self.filter_mask(categories, published_after, published_before, allowed_papers)
+
+        # === Global search: one FAISS call per chunk_type ===
+        type_queries: Dict[Optional[str], List[int]] = defaultdict(list)
+        for qi in range(nq):
+            if paper_ids[qi] is None:
+                type_queries[chunk_types[qi]].append(qi)
+
+        for chunk_type, query_ids in type_queries.items():
+            type_allowed = allowed
             if chunk_type:
-                candidate_indices = [
-                    idx for idx in candidate_indices 
-                    if self.metadata[idx].get("chunk_type") == chunk_type
-                ]
-            
-            if not candidate_indices:
-                return []
+                type_mask = self._bitmap(("chunk_type", chunk_type), lambda: self.metadata.chunk_type_mask(chunk_type))
+                type_allowed = type_mask if allowed is None else allowed & type_mask
 
-            # Get embeddings for candidate indices
-            all_embs = np.array([self.index.reconstruct(i) for i in candidate_indices], dtype=np.float32)
-            query = np_query[0]
+            distances, indices = self._filtered_search(np_queries[query_ids], top_k, type_allowed)
+            for row, qi in enumerate(query_ids):
+                for i, idx in enumerate(indices[row]):
+                    if idx != -1 and idx < len(self.metadata):
+                        result = self.metadata[idx]
+                        result["score"] = float(distances[row][i])
+                        results[qi].append(result)
 
-            # Compute L2 distance manually
-            distances = np.linalg.norm(all_embs - query, axis=1)
+        # === Restricted search (only within one paper) ===
+        paper_queries: Dict[str, List[int]] = defaultdict(list)
+        for qi in range(nq):
+            if paper_ids[qi] is not None:
+                paper_queries[paper_ids[qi]].append(qi)
 
-            # Rank results
-            top_indices = np.argsort(distances)[:min(top_k, len(distances))]
-            results = []
-            for j in top_indices:
-                meta = self.metadata[candidate_indices[j]].copy()
-                meta["score"] = float(distances[j])
-                results.append(meta)
-            
-            return results
+        for paper_id, query_ids in paper_queries.items():
+            if paper_id not in self.id_to_indices:
+                continue
+
+            candidate_indices, block, sq_norms, type_codes = self._paper_block(paper_id)
+
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2: one matrix product per paper
+            queries = np_queries[query_ids]
+            sq_dists = sq_norms[None, :] - 2.0 * (queries @ block.T) + np.einsum("ij,ij->i", queries, queries)[:, None]
+            all_distances = np.sqrt(np.maximum(sq_dists, 0.0))
+
+            for row, qi in enumerate(query_ids):
+                distances, candidates = all_distances[row], candidate_indices
+
+                # Filter by chunk_type / attributes if specified
+                mask = np.ones(len(candidates), dtype=bool)
+                if chunk_types[qi]:
+                    mask &= type_codes == self.metadata.chunk_type_code(chunk_types[qi])
+                if allowed is not None:
+                    mask &= allowed[candidates]
+                distances, candidates = distances[mask], candidates[mask]
+
+                if len(candidates) == 0:
+                    continue
+
+                # Rank results
+                k = min(top_k, len(distances))
+                top_indices = np.argpartition(distances, k - 1)[:k]
+                top_indices = top_indices[np.argsort(distances[top_indices])]
+                for j in top_indices:
+                    meta = self.metadata[int(candidates[j])]
+                    meta["score"] = float(distances[j])
+                    results[qi].append(meta)
+
+        return results
+
+    # ======================
+    # Filtered search
+    # ======================
+    def filter_mask(
+        self,
+        categories: Optional[Iterable[str]] = None,
+        published_after: Union[None, str, datetime.date] = None,
+        published_before: Union[None, str, datetime.date] = None,
+        allowed_papers: Optional[Iterable[str]] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Boolean mask over rows passing the attribute filters (and not deleted),
+        or None when nothing is filtered out. Per-attribute bitmaps are cached
+        until the next add / remove.
+        """
+        masks = []
+        live = self._live_mask()
+        if live is not None:
+            masks.append(live)
+        if categories is not None:
+            categories = tuple(sorted(categories))
+            masks.append(self._bitmap(("categories", categories), lambda: self.metadata.category_mask(categories)))
+        if published_after is not None or published_before is not None:
+            key = ("published", str(published_after), str(published_before))
+            masks.append(self._bitmap(key, lambda: self.metadata.published_mask(published_after, published_before)))
+        if allowed_papers is not None:
+            # Per-user, so not cached
+            masks.append(self.metadata.paper_mask(allowed_papers))
+
+        if not masks:
+            return None
+        mask = masks[0].copy()
+        for other in masks[1:]:
+            mask &= other
+        return mask
+
+    def _bitmap(self, key: tuple, build) -> np.ndarray:
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None or len(bitmap) != self.ntotal:
+            bitmap = build()
+            self._bitmaps[key] = bitmap
+        return bitmap
+
+    def _filtered_search(
+        self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k rows among those set in `allowed` (all rows if None), exact when
+        few rows match or the approximate index runs out of matching candidates.
+        """
+        n_allowed = self.ntotal if allowed is None else int(allowed.sum())
+        k = min(k, n_allowed)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+
+        if allowed is not None and n_allowed <= EXACT_FILTER_ROWS:
+            return self._exact_search(queries, np.flatnonzero(allowed), k)
+
+        if self._can_rerank():
+            # Shortlist from the compressed codes, then re-score exactly
+            fetch_k = min(k * self.index_config["rerank_factor"], n_allowed)
+            distances, indices = self._search_index(queries, fetch_k, allowed)
+            distances, indices = self._rerank(queries, indices, k)
+        else:
+            distances, indices = self._search_index(queries, k, allowed)
+
+        # IVF probes / the HNSW beam may hold fewer than k matching rows
+        short = (indices < 0).any(axis=1)
+        if allowed is not None and short.any():
+            distances[short], indices[short] = self._exact_search(queries[short], np.flatnonzero(allowed), k)
+        return distances, indices
+
+    def _exact_search(self, queries: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Brute-force squared L2 top-k over the given rows."""
+        vectors = self._reconstruct_batch(rows)
+        sq_dists = (
+            np.einsum("ij,ij->i", vectors, vectors)[None, :]
+            - 2.0 * (queries @ vectors.T)
+            + np.einsum("ij,ij->i", queries, queries)[:, None]
+        )
+        sq_dists = np.maximum(sq_dists, 0.0)
+        top = np.argpartition(sq_dists, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(sq_dists, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return np.take_along_axis(sq_dists, top, axis=1).astype(np.float32), rows[top]
+
+    def _search_index(
+        self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        FAISS search over the base index, merged with the read-only tail if any.
+
+        Args:
+            allowed: Optional boolean mask over rows; only rows where it is True
+                can be returned.
+        """
+        base_n = self.index.ntotal
+        base_allowed = allowed[:base_n] if allowed is not None else None
+        if self._tail_index is None or self._tail_index.ntotal == 0:
+            return self._search_filtered(self.index, queries, k, base_allowed)
+
+        base_d, base_i = self._search_filtered(self.index, queries, k, base_allowed)
+        tail_allowed = allowed[base_n:] if allowed is not None else None
+        tail_d, tail_i = self._search_filtered(self._tail_index, queries, k, tail_allowed)
+        tail_i = np.where(tail_i >= 0, tail_i + base_n, -1)
+
+        distances = np.hstack([base_d, tail_d])
+        indices = np.hstack([base_i, tail_i])
+        distances[indices < 0] = np.inf
+        order = np.argsort(distances, axis=1)[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    @staticmethod
+    def _search_filtered(
+        index: faiss.Index, queries: np.ndarray, k: int, allowed: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search one FAISS index, restricted to the rows set in `allowed` via an ID selector."""
+        if allowed is None or allowed.all():
+            return index.search(queries, k)
+
+        # The bitmap must stay alive for the duration of the search
+        bitmap = np.packbits(allowed, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        ivf = faiss.try_extract_index_ivf(index)
+        downcast = faiss.downcast_index(index)
+        if ivf is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        elif isinstance(downcast, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=downcast.hnsw.efSearch)
+        elif isinstance(downcast, faiss.IndexPQ):
+            # IndexPQ does not take a selector, but it is exhaustive: fetching
+            # k + #excluded rows and dropping the excluded ones is exact
+            fetch_k = min(k + int((~allowed).sum()), index.ntotal)
+            distances, indices = index.search(queries, fetch_k)
+            keep = (indices >= 0) & allowed[np.maximum(indices, 0)]
+            order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+            distances = np.where(keep, distances, np.inf)
+            indices = np.where(keep, indices, -1)
+            return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        return index.search(queries, k, params=params)
+
+    def _reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        """Fetch stored vectors by row id: exact copy if kept, else the base index or read-only tail."""
+        exact = self._exact_vectors(ids)
+        if exact is not None:
+            return exact
+        if self._tail_index is None:
+            return self.index.reconstruct_batch(ids)
+
+        base_n = self.index.ntotal
+        vectors = np.empty((len(ids), self.dim), dtype=np.float32)
+        in_base = ids < base_n
+        if in_base.any():
+            vectors[in_base] = self.index.reconstruct_batch(ids[in_base])
+        if (~in_base).any():
+            vectors[~in_base] = self._tail_index.reconstruct_batch(ids[~in_base] - base_n)
+        return vectors
+
+    # ======================
+    # Exact re-ranking
+    # ======================
+    def _exact_vectors(self, ids: np.ndarray) -> Optional[np.ndarray]:
+        """Exact float32 vectors for row ids, or None when no complete copy is kept."""
+        if not self.index_config["rerank"]:
+            return None
+
+        base_n = len(self._base_vectors) if self._base_vectors is not None else 0
+        if self._exact_tail is None:
+            tail = self._segment_vectors + self._unflushed_vectors
+            self._exact_tail = np.concatenate(tail) if tail else np.empty((0, self.dim), dtype=np.float32)
+        if base_n + len(self._exact_tail) != self.ntotal:
+            # e.g. a base saved before rerank was enabled
+            return None
+
+        vectors = np.empty((len(ids), self.dim), dtype=np.float32)
+        in_base = ids < base_n
+        if in_base.any():
+            vectors[in_base] = self._base_vectors[ids[in_base]]
+        if (~in_base).any():
+            vectors[~in_base] = self._exact_tail[ids[~in_base] - base_n]
+        return vectors
+
+    def _can_rerank(self) -> bool:
+        return self._exact_vectors(np.empty(0, dtype=np.int64)) is not None
+
+    def _rerank(self, queries: np.ndarray, indices: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-score a shortlist of row ids with exact squared L2 distances and keep the best k."""
+        valid = indices >= 0
+        vectors = self._exact_vectors(np.where(valid, indices, 0).ravel()).reshape(*indices.shape, self.dim)
+        distances = np.einsum("qkd,qkd->qk", vectors - queries[:, None, :], vectors - queries[:, None, :])
+        distances[~valid] = np.inf
+
+        order = np.argsort(distances, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        indices = np.take_along_axis(np.where(valid, indices, -1), order, axis=1)
+        return distances, indices
+
+    def _write_vectors(self, path: str, parts: List[np.ndarray], keep: Optional[np.ndarray] = None):
+        """Write the exact float32 copy (`parts` in row order, only rows `keep` if given) to a base `*_vectors.npy`."""
+        n_rows = sum(len(vectors) for vectors in parts) if keep is None else len(keep)
+
+        tmp_path = path + ".tmp"
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n_rows, self.dim))
+        offset = start = 0
+        for vectors in parts:
+            if keep is not None:
+                rows = keep[(keep >= start) & (keep < start + len(vectors))] - start
+                start += len(vectors)
+                vectors = vectors[rows]
+            out[offset:offset + len(vectors)] = vectors
+            offset += len(vectors)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _per_query(value, nq: int, name: str) -> List[Optional[str]]:
+        """Broadcast a single filter value to every query, or validate a per-query list."""
+        if value is None or isinstance(value, str):
+            return [value] * nq
+        value = list(value)
+        if len(value) != nq:
+            raise ValueError(f"{name} has {len(value)} entries, expected one per query ({nq})")
+        return value
+
+    def _paper_block(self, paper_id: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return (row ids, vectors, squared norms, chunk_type codes) for one paper.
+
+        The vectors are fetched with a single reconstruct_batch() call and cached
+        on this index instance as a contiguous matrix, so further searches on
+        the same paper through the same instance only pay for the
+        matrix-vector product.
+        """
+        block = self._paper_blocks.get(paper_id)
+        if block is None:
+            ids = np.asarray(self.id_to_indices[paper_id], dtype=np.int64)
+            vectors = np.ascontiguousarray(self._reconstruct_batch(ids), dtype=np.float32)
+            sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+            type_codes = np.asarray(self.metadata.column("chunk_type")[ids])
+            block = (ids, vectors, sq_norms, type_codes)
+            self._paper_blocks[paper_id] = block
+        return block
 
     def get_by_paper_id(self, paper_id: str, chunk_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -141,36 +859,37 @@ class FAISSIndex:
             paper_id: The paper ID to retrieve
             chunk_type: Optional filter by chunk type
         """
-        if paper_id not in self.id_to_indices:
-            return []
-        
-        indices = self.id_to_indices[paper_id]
-        results = []
-        
-        for idx in indices:
-            meta = self.metadata[idx].copy()
-            
-            # Filter by chunk_type if specified
-            if chunk_type and meta.get("chunk_type") != chunk_type:
-                continue
-                
-            meta["vector_index"] = idx
-            results.append(meta)
-        
-        return results
+        with self._reading():
+            if paper_id not in self.id_to_indices:
+                return []
+
+            indices = self.id_to_indices[paper_id]
+            results = []
+
+            for idx in indices:
+                # Filter by chunk_type if specified
+                if chunk_type and self.metadata.chunk_type(idx) != chunk_type:
+                    continue
+
+                meta = self.metadata[idx]
+                meta["vector_index"] = idx
+                results.append(meta)
+
+            return results
     
     def get_paper_stats(self, paper_id: str) -> Optional[Dict[str, Any]]:
         """Get statistics for a specific paper."""
-        if paper_id not in self.id_to_indices:
-            return None
-        
-        indices = self.id_to_indices[paper_id]
-        chunk_types = {}
-        
-        for idx in indices:
-            chunk_type = self.metadata[idx].get("chunk_type", "unknown")
-            chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
-        
+        with self._reading():
+            if paper_id not in self.id_to_indices:
+                return None
+
+            indices = self.id_to_indices[paper_id]
+            chunk_types = {}
+
+            for idx in indices:
+                chunk_type = self.metadata.chunk_type(idx)
+                chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
+
         return {
             "paper_id": paper_id,
             "total_chunks": len(indices),
@@ -178,54 +897,459 @@ class FAISSIndex:
             "indices": indices
         }
     
+    # ======================
+    # Persistence
+    # ======================
+    @staticmethod
+    def _empty_manifest() -> Dict[str, Any]:
+        return {
+            "base": None, "generation": 0, "base_rows": 0,
+            "segments": [], "next_segment": 0, "next_id": 0, "deleted": []
+        }
+
+    def _segment_prefix(self, name: str) -> str:
+        return os.path.join(os.path.dirname(self.index_path), name)
+
+    def _base_paths(self, name: Optional[str]) -> Dict[str, str]:
+        """Files of the base generation `name`; None is the un-versioned layout at `index_path`."""
+        if name is None:
+            return {"index": self.index_path, "metadata": self.metadata_prefix, "vectors": self.vectors_path}
+        prefix = self._segment_prefix(name)
+        return {"index": prefix + ".faiss", "metadata": prefix + "_meta", "vectors": prefix + "_vectors.npy"}
+
+    @property
+    def base_path(self) -> str:
+        """The .faiss file of the live base."""
+        return self._base_paths(self.manifest.get("base"))["index"]
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        """Atomically replace the manifest; this is the commit point of every save."""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        self.manifest = manifest
+
     def save(self):
-        """Save both the FAISS index and metadata + id_to_indices."""
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "metadata": self.metadata,
-                "id_to_indices": dict(self.id_to_indices)  # Convert defaultdict to dict
-            }, f, ensure_ascii=False, indent=2)
-    
-    def load(self):
-        """Load both the FAISS index and metadata + id_to_indices."""
-        if not os.path.exists(self.index_path):
-            raise FileNotFoundError(f"Index file not found: {self.index_path}")
-        
-        self.index = faiss.read_index(self.index_path)
+        """
+        Persist everything added since the last save.
+
+        The first save (or the first after `clear()`) writes the base files;
+        later saves only append a segment, so ingesting one paper costs
+        O(paper) instead of rewriting the whole index.
+        """
+        self._check_writable()
+        with self._lock:
+            with open(self.config_path, 'w', encoding='utf-8') as f:
+                json.dump({"dim": self.dim, **self.index_config}, f, indent=2)
+
+            if self._persisted_rows == 0 or not os.path.exists(self.manifest_path):
+                background = False
+            else:
+                self.flush()
+                too_many_deleted = len(self._deleted_rows) > self.max_deleted_fraction * max(self.ntotal, 1)
+                if len(self.manifest["segments"]) < self.max_segments and not too_many_deleted:
+                    return
+                background = self.background_compaction
+        # Outside the lock: compaction only takes it to snapshot and to swap
+        self.compact(background=background)
+
+    def flush(self):
+        """Write the unsaved vectors + metadata as a new immutable segment, and record deletions."""
+        self._check_writable()
+        with self._lock:
+            n_rows = len(self.metadata)
+            if n_rows == self._persisted_rows:
+                if self._unsaved_deletions:
+                    self._write_manifest(self._manifest_with_deletions(self.manifest))
+                    self._unsaved_deletions = []
+                return
+
+            name = f"{os.path.basename(self.index_path).replace('.faiss', '')}.seg{self.manifest['next_segment']:05d}"
+            prefix = self._segment_prefix(name)
+
+            # Write-ahead: segment files first, the manifest entry makes them live
+            vectors = np.concatenate(self._unflushed_vectors)
+            with open(prefix + ".npy.tmp", "wb") as f:
+                np.save(f, vectors)
+            os.replace(prefix + ".npy.tmp", prefix + ".npy")
+            segment_meta = MetadataStore.from_records(
+                [self.metadata[i] for i in range(self._persisted_rows, n_rows)]
+            )
+            segment_meta.save(prefix + "_meta")
+            segment_meta.close()
+
+            manifest = {
+                **self.manifest,
+                "segments": self.manifest["segments"] + [{
+                    "name": name,
+                    "start": self._persisted_rows,
+                    "rows": n_rows - self._persisted_rows,
+                    "first_id": self.metadata.vector_id(self._persisted_rows),
+                }],
+                "next_segment": self.manifest["next_segment"] + 1,
+            }
+            self._write_manifest(self._manifest_with_deletions(manifest))
+            self._unsaved_deletions = []
+            self._persisted_rows = n_rows
+            with self._swapping():
+                if self.index_config["rerank"]:
+                    self._segment_vectors.append(vectors)
+                self._unflushed_vectors = []
+                self._exact_tail = None
+
+    def _manifest_with_deletions(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            **manifest,
+            "next_id": self._next_id,
+            "deleted": manifest.get("deleted", []) + self._unsaved_deletions,
+        }
+
+    def compact(self, background: bool = False):
+        """
+        Rewrite the base index + metadata from memory and drop all segments.
+        Deleted rows are physically removed; the survivors keep their vector ids.
+        The new base is written without holding the index lock, so searches and
+        writes are only held up while it is swapped in.
+
+        Args:
+            background: Run in a daemon thread and return immediately.
+        """
+        self._check_writable()
+        if background:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self.compact, daemon=True)
+            self._compaction_thread.start()
+            return
+
+        with self._compaction_lock:
+            self._compact()
+
+    def _compact(self):
+        # Snapshot: everything persisted so far becomes the new base. Searches
+        # and writes go on while it is written; rows added meanwhile are
+        # carried over when the new base is swapped in.
+        with self._lock:
+            if self._persisted_rows and os.path.exists(self.manifest_path):
+                self.flush()
+            n_rows = len(self.metadata)
+            old_segments = self.manifest["segments"]
+            generation = self.manifest.get("generation", 0) + 1
+            dropped = set(self._deleted_rows)
+            keep = np.flatnonzero(self._live_mask()) if dropped else None
+            exact = None
+            if self._can_rerank():
+                exact = [self._base_vectors] if self._base_vectors is not None else []
+                exact += self._segment_vectors + self._unflushed_vectors
+            # A cloned index keeps its training (IVF centroids, quantizer codebooks)
+            index = faiss.clone_index(self.index)
+            kept_vectors = self._reconstruct_batch(keep) if dropped and exact is None else None
+            metadata = self.metadata.snapshot()
+            n_segment_vectors = len(self._segment_vectors)
+            n_unflushed = len(self._unflushed_vectors)
+
+        # The new base goes to files of its own; until the manifest names
+        # it, a crash leaves the previous base + segments intact
+        base = f"{os.path.basename(self.index_path).replace('.faiss', '')}.gen{generation:05d}"
+        paths = self._base_paths(base)
+        base_vectors = None
+        if exact is not None:
+            self._write_vectors(paths["vectors"], exact, keep)
+            base_vectors = np.load(paths["vectors"], mmap_mode="r")
+        if dropped:
+            index.reset()
+            vectors = kept_vectors if kept_vectors is not None else np.ascontiguousarray(base_vectors)
+            if len(vectors):
+                index.add(vectors)
+            metadata = MetadataStore.from_records([metadata[int(idx)] for idx in keep])
+        tmp_path = paths["index"] + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, paths["index"])
+        metadata.write(paths["metadata"])
+        base_rows = len(metadata)
+        # Serve the metadata from the new files (drops the in-memory rows)
+        metadata = MetadataStore.load(paths["metadata"])
+
+        with self._lock:
+            added = np.arange(n_rows, len(self.metadata))
+            metadata.extend([self.metadata[int(idx)] for idx in added])
+            if dropped and len(added):
+                index.add(self._reconstruct_batch(added))
+            # Rows deleted since the snapshot are still in the new base
+            still_deleted = sorted(self._deleted_rows - dropped)
+            deleted_ids = set(self.metadata.column("vector_id")[still_deleted].tolist())
+
+            shift = base_rows - n_rows
+            self._write_manifest({
+                **self.manifest, "base": base, "generation": generation, "base_rows": base_rows,
+                "segments": [
+                    {**segment, "start": segment["start"] + shift}
+                    for segment in self.manifest["segments"] if segment["start"] >= n_rows
+                ],
+                "next_id": self._next_id,
+                "deleted": [i for i in self.manifest.get("deleted", []) if i in deleted_ids],
+            })
+
+            with self._swapping():
+                old_metadata, self.metadata = self.metadata, metadata
+                if dropped:
+                    self.index = index
+                    rows = metadata.rows_for_ids(sorted(deleted_ids))
+                    self._deleted_rows = set(rows[rows >= 0].tolist())
+                    self._live_rows = None
+                    self.id_to_indices = defaultdict(list, metadata.indices_by_paper(self._live_mask()))
+                    self._maybe_train()
+                self._paper_blocks = {}
+                self._bitmaps = {}
+                self._persisted_rows = base_rows + max(self._persisted_rows - n_rows, 0)
+                self._unsaved_deletions = [i for i in self._unsaved_deletions if i in deleted_ids]
+                self._base_vectors = base_vectors
+                self._segment_vectors = self._segment_vectors[n_segment_vectors:]
+                self._unflushed_vectors = self._unflushed_vectors[n_unflushed:]
+                self._exact_tail = None
+                old_metadata.close()
+
+            for segment in old_segments:
+                self._remove_segment_files(segment["name"])
+            self._remove_stale_bases(base)
+
+    def wait_for_compaction(self):
+        """Block until a running background compaction has finished."""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+    def _remove_segment_files(self, name: str):
+        prefix = self._segment_prefix(name)
+        paths = [prefix + ".npy", *MetadataStore.paths(prefix + "_meta").values()]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _remove_stale_bases(self, live: str):
+        """
+        Delete the files of every base but `live`: the previous generation,
+        leftovers of an interrupted compaction, and the un-versioned layout.
+        Processes that memory-mapped a removed base keep their view of it;
+        a load() that read the old manifest retries with the new one.
+        """
+        paths = self._base_paths(None)
+        stale = [paths["index"], paths["vectors"], self.metadata_path, *MetadataStore.paths(paths["metadata"]).values()]
+        directory = os.path.dirname(self.index_path)
+        generation_prefix = os.path.basename(self.index_path).replace('.faiss', '') + ".gen"
+        for name in os.listdir(directory):
+            if name.startswith(generation_prefix) and not name.startswith((live + ".", live + "_")):
+                stale.append(os.path.join(directory, name))
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self, read_only: bool = False):
+        """
+        Load the base index + metadata named by the manifest, then replay the
+        live segments it lists. id_to_indices is rebuilt from the paper column.
+        Raises ValueError if the files do not line up (row counts of the base
+        index, its metadata and the manifest, or a segment out of place).
+
+        Args:
+            read_only: Memory-map the base index (FAISS mmap IO flag) so that
+                processes loading the same file share its pages. The index
+                then rejects add_embeddings() / save().
+        """
+        self.wait_for_compaction()
+        with self._compaction_lock, self._swapping():
+            for attempt in range(LOAD_RETRIES):
+                manifest = self._read_manifest()
+                try:
+                    self._load(read_only, manifest)
+                    return
+                except (FileNotFoundError, RuntimeError):
+                    # Another process compacted meanwhile and removed the files
+                    # this manifest named: start over from the new manifest
+                    if attempt == LOAD_RETRIES - 1 or self._read_manifest() == manifest:
+                        raise
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load(self, read_only: bool, manifest: Optional[Dict[str, Any]]):
+        base = manifest.get("base") if manifest is not None else None
+        paths = self._base_paths(base)
+        if not os.path.exists(paths["index"]):
+            raise FileNotFoundError(f"Index file not found: {paths['index']}")
+
+        # The persisted configuration describes the stored index and wins over
+        # constructor arguments; indexes saved before it existed are flat.
+        if os.path.exists(self.config_path):
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            if config.pop("dim", self.dim) != self.dim:
+                raise ValueError(f"Index at {self.index_path} was built for a different dimension")
+            self.index_config.update(config)
+        else:
+            self.index_config["index_type"] = "flat"
+
+        self.read_only = read_only
+        self._tail_index = None
+        if read_only:
+            # IO_FLAG_MMAP_IFC maps flat codes (flat / HNSW storage / IVF lists
+            # alike) on FAISS >= 1.9; older versions only map IVF lists
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            self.index = faiss.read_index(paths["index"], mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        else:
+            self.index = faiss.read_index(paths["index"])
+        self._apply_search_params()
         
-        if os.path.exists(self.metadata_path):
+        self.metadata.close()
+        if MetadataStore.exists(paths["metadata"]):
+            self.metadata = MetadataStore.load(paths["metadata"])
+        elif base is None and os.path.exists(self.metadata_path):
+            # Legacy JSON sidecar: migrated to the binary store on the next save()
             with open(self.metadata_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                self.metadata = data.get("metadata", [])
-                # Convert back to defaultdict
-                id_to_indices = data.get("id_to_indices", {})
-                self.id_to_indices = defaultdict(list, id_to_indices)
+            self.metadata = MetadataStore.from_records(data.get("metadata", []))
         else:
-            self.metadata = [{}] * self.index.ntotal
-            self.id_to_indices = defaultdict(list)
-            print(f"Warning: No metadata file found at {self.metadata_path}")
+            self.metadata = MetadataStore()
+            print(f"Warning: No metadata found at {paths['metadata']}")
+        self._paper_blocks = {}
+
+        if manifest is None:
+            manifest = self._empty_manifest()
+            manifest["base_rows"] = self.index.ntotal
+        self.manifest = manifest
+        if not self.index.ntotal == len(self.metadata) == manifest["base_rows"]:
+            raise ValueError(
+                f"Inconsistent index at {paths['index']}: {self.index.ntotal} vectors, "
+                f"{len(self.metadata)} metadata rows, manifest expects {manifest['base_rows']}"
+            )
+
+        self._base_vectors = None
+        if self.index_config["rerank"] and os.path.exists(paths["vectors"]):
+            self._base_vectors = np.load(paths["vectors"], mmap_mode="r")
+        self._segment_vectors = []
+
+        for segment in self.manifest["segments"]:
+            if segment["start"] != self.ntotal:
+                raise ValueError(
+                    f"Inconsistent index at {paths['index']}: segment {segment['name']} starts at row "
+                    f"{segment['start']}, expected {self.ntotal}"
+                )
+            prefix = self._segment_prefix(segment["name"])
+            vectors = np.load(prefix + ".npy")
+            segment_meta = MetadataStore.load(prefix + "_meta", first_id=segment["start"])
+            self._add(vectors, list(segment_meta))
+            segment_meta.close()
+            if self.index_config["rerank"]:
+                self._segment_vectors.append(vectors)
+
+        self._persisted_rows = self.ntotal
+        self._unflushed_vectors = []
+        self._exact_tail = None
+
+        # Replay deletions recorded since the last compaction
+        deleted_rows = self.metadata.rows_for_ids(self.manifest.get("deleted", []))
+        self._deleted_rows = set(deleted_rows[deleted_rows >= 0].tolist())
+        self._unsaved_deletions = []
+        self._live_rows = None
+        self._bitmaps = {}
+        self.id_to_indices = defaultdict(list, self.metadata.indices_by_paper(self._live_mask()))
+        last_id = self.metadata.vector_id(len(self.metadata) - 1) if len(self.metadata) else -1
+        self._next_id = max(self.manifest.get("next_id", 0), last_id + 1)
     
-    def get_stats(self) -> Dict[str, Any]:
-        """Get statistics about the index."""
-        # Count chunk types
-        chunk_types = {}
-        for meta in self.metadata:
-            chunk_type = meta.get("type", "unknown")
-            chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
-        
-        return {
-            "total_vectors": self.index.ntotal,
+    def get_stats(self, measure_recall: bool = False, k: int = 10, n_queries: int = 100) -> Dict[str, Any]:
+        """
+        Get statistics about the index.
+
+        Args:
+            measure_recall: Also measure recall@k of the (compressed) index against
+                exact search over the float32 copy. Needs `rerank=True`; this is a
+                brute-force pass over the corpus, so only use it offline.
+            k: Cut-off for the recall measurement.
+            n_queries: Number of stored vectors (plus noise) used as queries.
+        """
+        stats = {
+            "total_vectors": self.ntotal - len(self._deleted_rows),
+            "deleted_vectors": len(self._deleted_rows),
             "dimension": self.dim,
+            "index_config": dict(self.index_config),
+            "is_trained": self.is_trained,
             "metadata_entries": len(self.metadata),
             "unique_papers": len(self.id_to_indices),
-            "chunk_types": chunk_types,
+            "chunk_types": self.metadata.chunk_type_counts(self._live_mask()),
             "index_path": self.index_path,
-            "metadata_path": self.metadata_path
+            "metadata_path": MetadataStore.paths(self._base_paths(self.manifest.get("base"))["metadata"])["header"],
+            "live_segments": len(self.manifest["segments"]),
+            "unsaved_vectors": self.ntotal - self._persisted_rows,
+            "read_only": self.read_only,
+            "bytes_per_vector": self._bytes_per_vector(),
+            "float32_bytes_per_vector": self.dim * 4,
+            "exact_copy_on_disk": self._can_rerank()
+        }
+        if measure_recall:
+            stats["recall"] = self._measure_recall(k, n_queries)
+        return stats
+
+    def _bytes_per_vector(self) -> float:
+        """In-memory bytes per vector of the FAISS structure (codes + ids / graph links)."""
+        index = faiss.downcast_index(self.index)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # code + 64-bit id stored in the inverted list
+            return float(ivf.code_size + 8)
+        if isinstance(index, faiss.IndexHNSW):
+            links = index.hnsw.neighbors.size() * 4 / max(index.ntotal, 1)
+            return float(faiss.downcast_index(index.storage).sa_code_size() + links)
+        return float(index.sa_code_size())
+
+    def _measure_recall(self, k: int, n_queries: int) -> Optional[Dict[str, Any]]:
+        """recall@k of the index alone and with re-ranking, against exact float32 search."""
+        n = self.ntotal
+        if n == 0 or not self._can_rerank():
+            return None
+
+        exact = self._exact_vectors(np.arange(n))
+        rng = np.random.default_rng(0)
+        sample = rng.choice(n, size=min(n_queries, n), replace=False)
+        queries = exact[sample] + rng.normal(scale=0.01, size=(len(sample), self.dim)).astype(np.float32)
+        k = min(k, n)
+
+        _, truth = faiss.knn(queries, exact, k)
+        _, approx = self._search_index(queries, k)
+        fetch_k = min(k * self.index_config["rerank_factor"], n)
+        _, reranked = self._rerank(queries, self._search_index(queries, fetch_k)[1], k)
+
+        def recall(found: np.ndarray) -> float:
+            return sum(len(set(t) & set(f)) for t, f in zip(truth, found)) / truth.size
+
+        index_recall = recall(approx)
+        reranked_recall = recall(reranked)
+        return {
+            "k": k,
+            "index": index_recall,
+            "reranked": reranked_recall,
+            "recall_loss": 1.0 - index_recall,
+            "reranked_recall_loss": 1.0 - reranked_recall,
         }
     
     def clear(self):
-        """Clear the index, metadata, and id mapping."""
-        self.index = faiss.IndexFlatL2(self.dim)
-        self.metadata = []
-        self.id_to_indices = defaultdict(list)
\ No newline at end of file
+        """Clear the index, metadata, and id mapping. The next save() rewrites the base."""
+        self._check_writable()
+        with self._compaction_lock, self._lock, self._swapping():
+            self.index = self._build_index()
+            self.metadata.close()
+            self.metadata = MetadataStore()
+            self.id_to_indices = defaultdict(list)
+            self._paper_blocks = {}
+            self._persisted_rows = 0
+            self._unflushed_vectors = []
+            self._base_vectors = None
+            self._segment_vectors = []
+            self._exact_tail = None
+            # Vector ids keep counting up so that they are never reused
+            self._deleted_rows = set()
+            self._unsaved_deletions = []
+            self._live_rows = None
+            self._bitmaps = {}
\ No newline at end of file
@@ -0,0 +1,381 @@
+import datetime
+import json
+import mmap
+import os
+import numpy as np
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Union
+
+
+# Fixed-width row layout. paper_id and chunk_type are stored as codes into
+# small lookup tables kept in the header; everything else about a chunk
+# (content, image path, ...) lives as JSON in the content blob.
+# vector_id is the stable 64-bit id of the vector; ids increase with the row
+# number, so the column is sorted and can be binary-searched.
+ROW_DTYPE = np.dtype([
+    ("paper", "<i4"),
+    ("chunk_type", "<i2"),
+    ("chunk", "<i4"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("vector_id", "<i8"),
+])
+
+COLUMN_FIELDS = ("paper_id", "chunk_type", "chunk", "vector_id")
+# Attributes of the paper rather than of the chunk: stored once per paper in
+# the header and used to build row bitmaps for filtered search.
+PAPER_FIELDS = ("categories", "published")
+FORMAT_VERSION = 2
+
+
+class MetadataStore:
+    """
+    Compact on-disk metadata for a FAISSIndex.
+
+    Layout for a store saved at `prefix`:
+    - `<prefix>.header.json`: format version + paper_id / chunk_type lookup
+      tables + per-paper attributes (categories, published date).
+    - `<prefix>.rows.npy`: one fixed-width row per vector (see ROW_DTYPE).
+    - `<prefix>.blob`: concatenated JSON payloads, addressed by (offset, length).
+
+    Rows and blob are memory-mapped on load, so opening a store only costs the
+    lookup tables. Payloads are decoded on access, i.e. only for the hits a
+    search actually returns.
+    """
+
+    def __init__(self):
+        self._papers: List[str] = []
+        self._paper_codes: Dict[str, int] = {}
+        self._paper_attributes: List[Dict[str, Any]] = []
+        self._published_days: Optional[np.ndarray] = None
+        self._chunk_types: List[str] = []
+        self._chunk_type_codes: Dict[str, int] = {}
+
+        # Persisted rows (memory-mapped after load) and their content blob
+        self._rows = np.empty(0, dtype=ROW_DTYPE)
+        self._blob = b""
+        self._blob_file = None
+
+        # Rows added since the last save
+        self._pending_rows: List[tuple] = []
+        self._pending_payloads: List[bytes] = []
+        self._pending_size = 0
+
+        self._columns_cache: Optional[np.ndarray] = None
+
+    # ======================
+    # Construction
+    # ======================
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "MetadataStore":
+        """Build a store from a list of metadata dicts (e.g. the legacy JSON sidecar)."""
+        store = cls()
+        store.extend(records)
+        return store
+
+    def append(self, meta: Dict[str, Any]):
+        """
+        Append the metadata of one vector (must include 'paper_id' and 'chunk_type').
+
+        Without a 'vector_id' the row gets the id following the last row's.
+        """
+        paper = self._code(meta["paper_id"], self._papers, self._paper_codes)
+        if paper == len(self._paper_attributes):
+            self._paper_attributes.append({})
+        paper_fields = {k: meta[k] for k in PAPER_FIELDS if meta.get(k) is not None}
+        if paper_fields:
+            self._paper_attributes[paper].update(paper_fields)
+            self._published_days = None
+        chunk_type = self._code(meta["chunk_type"], self._chunk_types, self._chunk_type_codes)
+        chunk = meta.get("chunk")
+        vector_id = meta.get("vector_id")
+        if vector_id is None:
+            vector_id = self.vector_id(len(self) - 1) + 1 if len(self) else 0
+
+        payload_fields = {k: v for k, v in meta.items() if k not in COLUMN_FIELDS and k not in PAPER_FIELDS}
+        # A non-integer chunk value cannot go into the fixed-width column
+        if chunk is not None and not isinstance(chunk, int):
+            payload_fields["chunk"] = chunk
+            chunk = None
+        payload = json.dumps(payload_fields, ensure_ascii=False).encode("utf-8") if payload_fields else b""
+
+        offset = len(self._blob) + self._pending_size
+        self._pending_rows.append(
+            (paper, chunk_type, -1 if chunk is None else chunk, offset, len(payload), int(vector_id))
+        )
+        self._pending_payloads.append(payload)
+        self._pending_size += len(payload)
+        self._columns_cache = None
+
+    def extend(self, metas: List[Dict[str, Any]]):
+        for meta in metas:
+            self.append(meta)
+
+    def snapshot(self) -> "MetadataStore":
+        """
+        Frozen copy of the current rows, e.g. to write() them while this store
+        keeps growing. It shares the persisted rows and blob: do not close() it.
+        """
+        store = MetadataStore()
+        store._papers = list(self._papers)
+        store._paper_codes = dict(self._paper_codes)
+        store._paper_attributes = [dict(attrs) for attrs in self._paper_attributes]
+        store._chunk_types = list(self._chunk_types)
+        store._chunk_type_codes = dict(self._chunk_type_codes)
+        store._rows = self._rows
+        store._blob = self._blob
+        store._pending_rows = list(self._pending_rows)
+        store._pending_payloads = list(self._pending_payloads)
+        store._pending_size = self._pending_size
+        return store
+
+    @staticmethod
+    def _code(value: str, table: List[str], codes: Dict[str, int]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = len(table)
+            table.append(value)
+            codes[value] = code
+        return code
+
+    # ======================
+    # Access
+    # ======================
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._pending_rows)
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        """Materialise the full metadata dict of one vector."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Metadata index {idx} out of range")
+
+        n_persisted = len(self._rows)
+        if idx < n_persisted:
+            paper, chunk_type, chunk, offset, length, vector_id = self._rows[idx].tolist()
+            payload = self._blob[offset:offset + length]
+        else:
+            paper, chunk_type, chunk, _, _, vector_id = self._pending_rows[idx - n_persisted]
+            payload = self._pending_payloads[idx - n_persisted]
+
+        meta = json.loads(bytes(payload).decode("utf-8")) if payload else {}
+        meta["paper_id"] = self._papers[paper]
+        meta.update(self._paper_attributes[paper])
+        meta["chunk_type"] = self._chunk_types[chunk_type]
+        if chunk >= 0:
+            meta["chunk"] = chunk
+        meta["vector_id"] = vector_id
+        return meta
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def paper_id(self, idx: int) -> str:
+        return self._papers[int(self.column("paper")[idx])]
+
+    def chunk_type(self, idx: int) -> str:
+        return self._chunk_types[int(self.column("chunk_type")[idx])]
+
+    def vector_id(self, idx: int) -> int:
+        return int(self.column("vector_id")[idx])
+
+    def rows_for_ids(self, vector_ids) -> np.ndarray:
+        """Map stable vector ids to row indices (-1 for unknown ids)."""
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        column = self.column("vector_id")
+        if len(column) == 0:
+            return np.full(vector_ids.shape, -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(column, vector_ids), len(column) - 1)
+        return np.where(column[rows] == vector_ids, rows, -1)
+
+    def column(self, name: str) -> np.ndarray:
+        """Return one fixed-width column ("paper", "chunk_type", "chunk", "vector_id") for all rows."""
+        if self._columns_cache is None:
+            if self._pending_rows:
+                pending = np.array(self._pending_rows, dtype=ROW_DTYPE)
+                self._columns_cache = np.concatenate([self._rows, pending])
+            else:
+                self._columns_cache = self._rows
+        return self._columns_cache[name]
+
+    def paper_code(self, paper_id: str) -> Optional[int]:
+        return self._paper_codes.get(paper_id)
+
+    def chunk_type_code(self, chunk_type: str) -> Optional[int]:
+        return self._chunk_type_codes.get(chunk_type)
+
+    # ======================
+    # Row bitmaps for filtered search
+    # ======================
+    def paper_mask(self, paper_ids: Iterable[str]) -> np.ndarray:
+        """Boolean mask over rows belonging to any of the given papers."""
+        codes = [c for c in (self._paper_codes.get(p) for p in paper_ids) if c is not None]
+        return np.isin(self.column("paper"), codes)
+
+    def chunk_type_mask(self, chunk_type: str) -> np.ndarray:
+        """Boolean mask over rows of one chunk type."""
+        code = self._chunk_type_codes.get(chunk_type)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.column("chunk_type") == code
+
+    def category_mask(self, categories: Iterable[str]) -> np.ndarray:
+        """Boolean mask over rows whose paper has any of the given categories."""
+        wanted = set(categories)
+        codes = [i for i, attrs in enumerate(self._paper_attributes) if wanted & set(attrs.get("categories") or [])]
+        return np.isin(self.column("paper"), codes)
+
+    def published_mask(
+        self,
+        after: Union[None, str, datetime.date] = None,
+        before: Union[None, str, datetime.date] = None
+    ) -> np.ndarray:
+        """Boolean mask over rows whose paper was published in [after, before]; undated papers never match."""
+        if self._published_days is None:
+            self._published_days = np.array(
+                [_to_ordinal(attrs.get("published")) for attrs in self._paper_attributes] or [0], dtype=np.int64
+            )
+        days = self._published_days[self.column("paper")]
+        mask = days > 0
+        if after is not None:
+            mask &= days >= _to_ordinal(after)
+        if before is not None:
+            mask &= days <= _to_ordinal(before)
+        return mask
+
+    def indices_by_paper(self, live: Optional[np.ndarray] = None) -> Dict[str, List[int]]:
+        """
+        Group row indices by paper_id, preserving insertion order within a paper.
+
+        Args:
+            live: Optional boolean mask over rows; rows where it is False are skipped.
+        """
+        papers = self.column("paper")
+        rows = np.arange(len(papers)) if live is None else np.flatnonzero(live)
+        if len(rows) == 0:
+            return {}
+        order = rows[np.argsort(papers[rows], kind="stable")]
+        codes, starts = np.unique(papers[order], return_index=True)
+        groups = np.split(order, starts[1:])
+        return {self._papers[int(code)]: group.tolist() for code, group in zip(codes, groups)}
+
+    def chunk_type_counts(self, live: Optional[np.ndarray] = None) -> Dict[str, int]:
+        chunk_types = self.column("chunk_type")
+        if live is not None:
+            chunk_types = chunk_types[live]
+        counts = np.bincount(chunk_types, minlength=len(self._chunk_types))
+        return {name: int(count) for name, count in zip(self._chunk_types, counts) if count}
+
+    # ======================
+    # Persistence
+    # ======================
+    @staticmethod
+    def paths(prefix: str) -> Dict[str, str]:
+        return {
+            "header": f"{prefix}.header.json",
+            "rows": f"{prefix}.rows.npy",
+            "blob": f"{prefix}.blob",
+        }
+
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return os.path.exists(cls.paths(prefix)["header"])
+
+    def save(self, prefix: str):
+        """write() the store, then serve it from the written files."""
+        self.write(prefix)
+        # Re-open what we just wrote so the in-memory copy is dropped
+        self._open(prefix)
+
+    def write(self, prefix: str):
+        """Write header, rows and blob. Files are replaced atomically, header last."""
+        paths = self.paths(prefix)
+
+        rows = np.concatenate([self._rows, np.array(self._pending_rows, dtype=ROW_DTYPE)])
+        with open(paths["rows"] + ".tmp", "wb") as f:
+            np.save(f, rows)
+
+        with open(paths["blob"] + ".tmp", "wb") as f:
+            if len(self._blob):
+                f.write(memoryview(self._blob))
+            for payload in self._pending_payloads:
+                f.write(payload)
+
+        with open(paths["header"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "rows": len(rows),
+                "papers": self._papers,
+                "paper_attributes": self._paper_attributes,
+                "chunk_types": self._chunk_types,
+            }, f, ensure_ascii=False)
+
+        for key in ("rows", "blob", "header"):
+            os.replace(paths[key] + ".tmp", paths[key])
+
+    @classmethod
+    def load(cls, prefix: str, first_id: int = 0) -> "MetadataStore":
+        """
+        Open a saved store.
+
+        Args:
+            first_id: vector_id of the first row of a version 1 store, which has
+                no id column; its rows are numbered consecutively from there.
+        """
+        store = cls()
+        store._open(prefix, first_id)
+        return store
+
+    def _open(self, prefix: str, first_id: int = 0):
+        paths = self.paths(prefix)
+        with open(paths["header"], "r", encoding="utf-8") as f:
+            header = json.load(f)
+        version = header.get("version")
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError(f"Unsupported metadata format version {version} at {prefix}")
+
+        self._papers = header["papers"]
+        self._paper_codes = {p: i for i, p in enumerate(self._papers)}
+        self._paper_attributes = header.get("paper_attributes") or [{} for _ in self._papers]
+        self._published_days = None
+        self._chunk_types = header["chunk_types"]
+        self._chunk_type_codes = {c: i for i, c in enumerate(self._chunk_types)}
+
+        self._rows = np.load(paths["rows"], mmap_mode="r")
+        if version == 1:
+            # Upgraded in memory; the next save() writes the current format
+            rows = np.empty(len(self._rows), dtype=ROW_DTYPE)
+            for name in self._rows.dtype.names:
+                rows[name] = self._rows[name]
+            rows["vector_id"] = first_id + np.arange(len(rows))
+            self._rows = rows
+        self.close()
+        if os.path.getsize(paths["blob"]) > 0:
+            self._blob_file = open(paths["blob"], "rb")
+            self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+
+        self._pending_rows = []
+        self._pending_payloads = []
+        self._pending_size = 0
+        self._columns_cache = None
+
+    def close(self):
+        """Release the memory-mapped blob."""
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        if self._blob_file is not None:
+            self._blob_file.close()
+            self._blob_file = None
+        self._blob = b""
+
+
+def _to_ordinal(value: Union[None, str, datetime.date]) -> int:
+    """Day number of a date or ISO date string (0 if missing)."""
+    if value is None:
+        return 0
+    if isinstance(value, datetime.date):
+        return value.toordinal()
+    return datetime.date.fromisoformat(str(value)[:10]).toordinal()
@@ -0,0 +1,146 @@
+import logging
+import os
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+DEFAULT_ONNX_DIR = os.getenv("ONNX_MODEL_DIR", "storage/onnx")
+ONNX_OPSET = 17
+
+# Encoder name -> (model inputs, output name)
+ENCODERS = {
+    "text": (None, "last_hidden_state"),  # BGE, inputs taken from its tokenizer
+    "clip_text": (["input_ids", "attention_mask"], "text_embeds"),
+    "clip_vision": (["pixel_values"], "image_embeds"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def encoder_paths(img_model_name: str, text_model_name: str, onnx_dir: str = DEFAULT_ONNX_DIR, quantize: bool = True) -> Dict[str, str]:
+    """Where the ONNX graph of each encoder lives, e.g. storage/onnx/BAAI--bge-small-en-v1.5/text.int8.onnx."""
+    suffix = ".int8.onnx" if quantize else ".onnx"
+    return {
+        "text": os.path.join(onnx_dir, text_model_name.replace("/", "--"), "text" + suffix),
+        "clip_text": os.path.join(onnx_dir, img_model_name.replace("/", "--"), "clip_text" + suffix),
+        "clip_vision": os.path.join(onnx_dir, img_model_name.replace("/", "--"), "clip_vision" + suffix),
+    }
+
+
+def export_encoders(
+    img_model_name: str,
+    text_model_name: str,
+    onnx_dir: str = DEFAULT_ONNX_DIR,
+    quantize: bool = True,
+    encoders: Iterable[str] = tuple(ENCODERS)
+) -> Dict[str, str]:
+    """
+    Export the BGE encoder and the CLIP text / vision towers (or only the
+    given `encoders`) to ONNX once, and with `quantize` apply dynamic int8
+    quantization to their MatMul weights. Graphs that already exist are
+    reused. Returns encoder_paths().
+    """
+    paths = encoder_paths(img_model_name, text_model_name, onnx_dir, quantize)
+    missing = [name for name in encoders if not os.path.exists(paths[name])]
+    if not missing:
+        return paths
+
+    import torch
+    from transformers import AutoModel, AutoTokenizer, CLIPModel, CLIPTokenizer
+
+    class TextEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+    class ClipTextTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    class ClipVisionTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    sample = ["A diagram of a neural network", "Quantum entanglement in physics"]
+    if "text" in missing:
+        tokenizer = AutoTokenizer.from_pretrained(text_model_name)
+        encoder = TextEncoder(AutoModel.from_pretrained(text_model_name).eval())
+        encoder.input_names = list(tokenizer.model_input_names)
+        inputs = tokenizer(sample, padding=True, return_tensors="pt")
+        _export(encoder, tuple(inputs[name] for name in encoder.input_names), encoder.input_names,
+                ENCODERS["text"][1], paths["text"], quantize)
+
+    if "clip_text" in missing or "clip_vision" in missing:
+        clip_model = CLIPModel.from_pretrained(img_model_name).eval()
+        if "clip_text" in missing:
+            inputs = CLIPTokenizer.from_pretrained(img_model_name)(sample, padding=True, return_tensors="pt")
+            input_names = ENCODERS["clip_text"][0]
+            _export(ClipTextTower(clip_model), tuple(inputs[name] for name in input_names), input_names,
+                    ENCODERS["clip_text"][1], paths["clip_text"], quantize)
+        if "clip_vision" in missing:
+            image_size = clip_model.config.vision_config.image_size
+            _export(ClipVisionTower(clip_model), (torch.randn(2, 3, image_size, image_size),), ENCODERS["clip_vision"][0],
+                    ENCODERS["clip_vision"][1], paths["clip_vision"], quantize)
+
+    return paths
+
+
+def _export(module, args: tuple, input_names, output_name: str, path: str, quantize: bool):
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fp32_path = path.replace(".int8.onnx", ".onnx")
+    if not os.path.exists(fp32_path):
+        dynamic_axes = {name: {0: "batch"} if name == "pixel_values" else {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes[output_name] = {0: "batch"}
+        with torch.no_grad():
+            torch.onnx.export(
+                module, args, fp32_path,
+                input_names=list(input_names),
+                output_names=[output_name],
+                dynamic_axes=dynamic_axes,
+                opset_version=ONNX_OPSET,
+                dynamo=False,
+            )
+        logger.info(f"Exported {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # MatMul weights only: quantizing the embedding Gathers costs accuracy for little speed
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul"])
+        logger.info(f"Quantized {path}")
+
+
+class OnnxEncoder:
+    """One exported encoder run with ONNX Runtime on CPU; called with numpy inputs."""
+
+    def __init__(self, path: str, intra_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def __call__(self, inputs) -> np.ndarray:
+        feeds = {}
+        for name in self.input_names:
+            value = np.asarray(inputs[name])
+            feeds[name] = value.astype(np.float32 if name == "pixel_values" else np.int64, copy=False)
+        return self.session.run(None, feeds)[0]
@@ -0,0 +1,281 @@
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+from agents.data.indexing import FAISSIndex
+
+
+# Size of the scatter-gather pool shared by every ShardedFAISSIndex
+SHARD_THREADS = int(os.getenv("FAISS_SHARD_THREADS", str(os.cpu_count() or 8)))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _shard_executor() -> ThreadPoolExecutor:
+    """Process-wide pool: indexes are opened per request, so they must not each start threads."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SHARD_THREADS, thread_name_prefix="faiss-shard")
+        return _executor
+
+
+class ShardedFAISSIndex:
+    """
+    FAISSIndex partitioned into `n_shards` shard files by paper_id hash.
+
+    Shard i of `faiss_index/text_index.faiss` lives at
+    `faiss_index/text_index.shard<i>.faiss` (with its own metadata, segments
+    and config); the shard count is persisted in `*_shards.json` so a layout
+    is always reopened with the hash it was built with.
+
+    A paper lives entirely in one shard, so paper-restricted search,
+    get_by_paper_id() and remove_paper() / upsert_paper() / replace_paper()
+    touch one shard only.
+    Global search is scattered to all shards on a thread pool shared by every
+    sharded index (FAISS releases the GIL while searching) and the per-shard
+    top-k lists are merged.
+
+    Exposes the same add_embeddings / search / search_batch / get_by_paper_id
+    interface as FAISSIndex. Note that `vector_id`s are unique per shard only.
+    """
+
+    def __init__(self, dim: int, index_path: str, n_shards: int = 8, **index_kwargs):
+        if n_shards < 1:
+            raise ValueError(f"n_shards must be positive, got {n_shards}")
+
+        self.dim = dim
+        self.index_path = index_path
+        self.shards_path = index_path.replace('.faiss', '_shards.json')
+        self.n_shards = n_shards
+        self.index_kwargs = index_kwargs
+        self.shards = [self._make_shard(i) for i in range(n_shards)]
+
+    def _make_shard(self, i: int) -> FAISSIndex:
+        shard_path = self.index_path.replace('.faiss', f'.shard{i:02d}.faiss')
+        return FAISSIndex(dim=self.dim, index_path=shard_path, **self.index_kwargs)
+
+    @classmethod
+    def exists(cls, index_path: str) -> bool:
+        return os.path.exists(index_path.replace('.faiss', '_shards.json'))
+
+    @classmethod
+    def open(cls, dim: int, index_path: str, read_only: bool = False, n_shards: int = 8, **kwargs) -> "ShardedFAISSIndex":
+        """Create a sharded index and load it from disk if it was saved before."""
+        if cls.exists(index_path):
+            with open(index_path.replace('.faiss', '_shards.json'), 'r', encoding='utf-8') as f:
+                n_shards = json.load(f)["n_shards"]
+        index = cls(dim=dim, index_path=index_path, n_shards=n_shards, **kwargs)
+        if cls.exists(index_path):
+            index.load(read_only=read_only)
+        return index
+
+    def shard_for(self, paper_id: str) -> int:
+        # crc32 rather than hash(): str hashing is salted per process
+        return zlib.crc32(str(paper_id).encode("utf-8")) % self.n_shards
+
+    def _map(self, fn, shards: Optional[List[FAISSIndex]] = None) -> list:
+        """Run fn(shard) on every shard in parallel, results in shard order."""
+        return list(_shard_executor().map(fn, shards if shards is not None else self.shards))
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    @property
+    def read_only(self) -> bool:
+        return all(shard.read_only for shard in self.shards)
+
+    # ======================
+    # Writes
+    # ======================
+    def add_embeddings(self, embeddings, metadatas: List[Dict[str, Any]]):
+        """Add embeddings and their metadata, routed to shards by paper_id."""
+        if len(embeddings) == 0:
+            return
+        if len(embeddings) != len(metadatas):
+            raise ValueError("Number of embeddings must match number of metadata entries")
+
+        by_shard: Dict[int, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            if "paper_id" not in meta:
+                raise ValueError(f"Metadata {i} must include a 'paper_id'")
+            by_shard.setdefault(self.shard_for(meta["paper_id"]), []).append(i)
+
+        np_embs = np.asarray(embeddings, dtype=np.float32)
+        for shard_id, rows in by_shard.items():
+            self.shards[shard_id].add_embeddings(np_embs[rows], [metadatas[i] for i in rows])
+
+    def remove_paper(self, paper_id: str) -> int:
+        return self.shards[self.shard_for(paper_id)].remove_paper(paper_id)
+
+    def upsert_paper(self, paper_id: str, embeddings, metadatas: List[Dict[str, Any]]) -> bool:
+        return self.shards[self.shard_for(paper_id)].upsert_paper(paper_id, embeddings, metadatas)
+
+    def replace_paper(self, paper_id: str, batches: Iterable[Tuple[Any, List[Dict[str, Any]]]]) -> int:
+        return self.shards[self.shard_for(paper_id)].replace_paper(paper_id, batches)
+
+    # ======================
+    # Search
+    # ======================
+    def search(
+        self,
+        query_emb: List[float],
+        top_k: int = 5,
+        paper_id: Optional[str] = None,
+        chunk_type: Optional[str] = None,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """Search for similar embeddings (see FAISSIndex.search)."""
+        if len(query_emb) != self.dim:
+            raise ValueError(f"Query embedding has dimension {len(query_emb)}, expected {self.dim}")
+
+        if paper_id is not None:
+            return self.shards[self.shard_for(paper_id)].search(query_emb, top_k, paper_id, chunk_type, **filters)
+        return self.search_batch([query_emb], top_k, chunk_types=chunk_type, **filters)[0]
+
+    def search_batch(
+        self,
+        query_embs,
+        top_k: int = 5,
+        paper_ids: Union[None, str, List[Optional[str]]] = None,
+        chunk_types: Union[None, str, List[Optional[str]]] = None,
+        **filters
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search many queries at once (see FAISSIndex.search_batch for the
+        attribute filters, which every shard applies to its own rows).
+
+        Global queries go to every shard in parallel and the per-shard top-k
+        lists are merged by score; paper-restricted queries only go to the
+        shard owning the paper.
+        """
+        np_queries = np.atleast_2d(np.asarray(query_embs, dtype=np.float32))
+        if np_queries.shape[1] != self.dim:
+            raise ValueError(f"Query embeddings have dimension {np_queries.shape[1]}, expected {self.dim}")
+
+        nq = len(np_queries)
+        # Every shard iterates the collection filters, so they must not be one-shot iterators
+        filters = {
+            key: list(value) if key in ("categories", "allowed_papers") and value is not None else value
+            for key, value in filters.items()
+        }
+        paper_ids = FAISSIndex._per_query(paper_ids, nq, "paper_ids")
+        chunk_types = FAISSIndex._per_query(chunk_types, nq, "chunk_types")
+        results: List[List[Dict[str, Any]]] = [[] for _ in range(nq)]
+
+        # Every shard gets the global queries plus the restricted ones it owns
+        shard_queries: List[List[int]] = [[] for _ in range(self.n_shards)]
+        for qi in range(nq):
+            if paper_ids[qi] is None:
+                for queries in shard_queries:
+                    queries.append(qi)
+            else:
+                shard_queries[self.shard_for(paper_ids[qi])].append(qi)
+
+        def search_shard(shard_id: int) -> List[List[Dict[str, Any]]]:
+            query_ids = shard_queries[shard_id]
+            if not query_ids:
+                return []
+            return self.shards[shard_id].search_batch(
+                np_queries[query_ids],
+                top_k,
+                paper_ids=[paper_ids[qi] for qi in query_ids],
+                chunk_types=[chunk_types[qi] for qi in query_ids],
+                **filters,
+            )
+
+        for shard_id, shard_results in enumerate(_shard_executor().map(search_shard, range(self.n_shards))):
+            for qi, hits in zip(shard_queries[shard_id], shard_results):
+                results[qi].extend(hits)
+
+        for qi in range(nq):
+            if paper_ids[qi] is None:
+                results[qi] = sorted(results[qi], key=lambda hit: hit["score"])[:top_k]
+        return results
+
+    def get_by_paper_id(self, paper_id: str, chunk_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.shards[self.shard_for(paper_id)].get_by_paper_id(paper_id, chunk_type)
+
+    def get_paper_stats(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        return self.shards[self.shard_for(paper_id)].get_paper_stats(paper_id)
+
+    # ======================
+    # Persistence
+    # ======================
+    def save(self):
+        """Save every shard (in parallel), then the shard layout."""
+        self._map(lambda shard: shard.save())
+        with open(self.shards_path, 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim, "n_shards": self.n_shards}, f, indent=2)
+
+    def load(self, read_only: bool = False):
+        """Load every shard that was saved; shards without files stay empty."""
+        def load_shard(shard: FAISSIndex):
+            if FAISSIndex.exists(shard.index_path):
+                shard.load(read_only=read_only)
+            else:
+                shard.read_only = read_only
+        self._map(load_shard)
+
+    def compact(self, background: bool = False):
+        self._map(lambda shard: shard.compact(background=background))
+
+    def wait_for_compaction(self):
+        for shard in self.shards:
+            shard.wait_for_compaction()
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aggregate statistics over the shards, plus the per-shard stats."""
+        shard_stats = [shard.get_stats() for shard in self.shards]
+        chunk_types: Dict[str, int] = {}
+        for stats in shard_stats:
+            for chunk_type, count in stats["chunk_types"].items():
+                chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + count
+
+        return {
+            "total_vectors": sum(s["total_vectors"] for s in shard_stats),
+            "dimension": self.dim,
+            "n_shards": self.n_shards,
+            "unique_papers": sum(s["unique_papers"] for s in shard_stats),
+            "chunk_types": chunk_types,
+            "index_path": self.index_path,
+            "read_only": self.read_only,
+            "shards": shard_stats,
+        }
+
+
+def open_index(dim: int, index_path: str, read_only: bool = False, n_shards: int = 1, **kwargs):
+    """
+    Open the index stored at `index_path`, sharded or not.
+
+    An existing sharded layout is always opened as a ShardedFAISSIndex;
+    otherwise `n_shards > 1` creates a new sharded index and 1 a plain FAISSIndex.
+    Raises ValueError for `n_shards > 1` when a plain index is stored there,
+    rather than starting an empty sharded index next to it.
+    """
+    if ShardedFAISSIndex.exists(index_path):
+        return ShardedFAISSIndex.open(dim, index_path, read_only=read_only, n_shards=n_shards, **kwargs)
+    if n_shards > 1:
+        if FAISSIndex.exists(index_path):
+            raise ValueError(
+                f"{index_path} holds an unsharded index; re-index it to use n_shards={n_shards}, "
+                f"or open it with n_shards=1"
+            )
+        return ShardedFAISSIndex.open(dim, index_path, read_only=read_only, n_shards=n_shards, **kwargs)
+    return FAISSIndex.open(dim, index_path, read_only=read_only, **kwargs)
+
+
+def index_exists(index_path: str) -> bool:
+    """True if a plain or sharded index was saved at `index_path`."""
+    return FAISSIndex.exists(index_path) or ShardedFAISSIndex.exists(index_path)
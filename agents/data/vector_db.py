@@ -2,12 +2,249 @@ from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple, Iterable
+import faiss
+import numpy as np
 from dotenv import load_dotenv
 import pickle
 load_dotenv()
 
+DEFAULT_PERSIST_PATH = "faiss_index/faiss_index"
+# HNSW graph used for corpus-wide (discover) search over the stored abstracts
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 256
+# Below this many papers a brute-force matmul is faster than building / searching the graph
+EXACT_SEARCH_PAPERS = 10000
+
+
+def _paper_rows_path(persist_path: str) -> str:
+    return os.path.join(persist_path, "paper_rows.json")
+
+
+def _paper_rows(docstore, index_to_docstore_id: Dict[int, str]) -> Dict[str, int]:
+    """paper_id -> FAISS row; later rows win, so a paper stored twice maps to its latest abstract."""
+    rows = {}
+    for row in sorted(index_to_docstore_id):
+        doc = docstore.search(index_to_docstore_id[row])
+        if isinstance(doc, Document) and doc.metadata.get("id"):
+            rows[doc.metadata["id"]] = int(row)
+    return rows
+
+
+def _write_paper_rows(persist_path: str, rows: Dict[str, int], ntotal: int, ann: Optional[str] = None):
+    """Atomically replace paper_rows.json, so concurrent readers never see a partial map."""
+    path = _paper_rows_path(persist_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"ntotal": ntotal, "rows": rows, "ann": ann}, f)
+    os.replace(path + ".tmp", path)
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8), dtype=np.float32)
+
+
+def _write_ann_index(persist_path: str, unit: np.ndarray, ntotal: int) -> Optional[str]:
+    """
+    Build the HNSW inner-product graph over `unit` (rows in paper_rows order)
+    and save it next to index.faiss; returns its file name, or None when the
+    corpus is small enough for exact search. The name carries the index size,
+    so the graph of an older paper_rows.json is never overwritten under a reader.
+    """
+    if len(unit) < EXACT_SEARCH_PAPERS:
+        return None
+    index = faiss.IndexHNSWFlat(unit.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.add(unit)
+    name = f"papers_hnsw.{ntotal}.faiss"
+    path = os.path.join(persist_path, name)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return name
+
+
+def _remove_stale_ann_indexes(persist_path: str, live: Optional[str]):
+    for name in os.listdir(persist_path):
+        if name.startswith("papers_hnsw.") and name != live:
+            os.remove(os.path.join(persist_path, name))
+
+
+def build_paper_rows(persist_path: str = DEFAULT_PERSIST_PATH) -> Dict[str, int]:
+    """Rebuild the paper_id -> row map of a store from its LangChain docstore (index.pkl), in memory."""
+    with open(os.path.join(persist_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return _paper_rows(docstore, index_to_docstore_id)
+
+
+class PaperEmbeddingLookup:
+    """
+    paper_id -> stored abstract vector of the PaperVectorStore, without
+    loading the embedding model or searching.
+
+    The FAISS index is read once and its vectors kept as one float32 matrix;
+    a paper_id -> row map (paper_rows.json, maintained by store_papers())
+    turns a lookup into a dict access plus a row copy. Files are re-read only
+    when the index or the map on disk changes. search() uses the HNSW graph that
+    store_papers() saves for large corpora; it is never built here.
+    """
+
+    def __init__(self, persist_path: str = DEFAULT_PERSIST_PATH):
+        self.persist_path = persist_path
+        self.index_file = os.path.join(persist_path, "index.faiss")
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.rows: Dict[str, int] = {}
+        self._snapshot = None
+        self._ann = None
+        self._ann_graph: Optional[faiss.Index] = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if not os.path.exists(self.index_file):
+            raise FileNotFoundError(f"FAISS index file not found at {self.index_file}")
+
+        # paper_rows.json is written after index.faiss: a reader that came in
+        # between picks up the new map (and graph) on its next call
+        rows_path = _paper_rows_path(self.persist_path)
+        mtime = (
+            os.stat(self.index_file).st_mtime_ns,
+            os.stat(rows_path).st_mtime_ns if os.path.exists(rows_path) else None,
+        )
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            index = faiss.read_index(self.index_file)
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype=np.float32)
+
+            rows, graph = None, None
+            if os.path.exists(rows_path):
+                with open(rows_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                # A map written for a different index (older store) is rebuilt
+                if saved.get("ntotal") == index.ntotal:
+                    rows = saved["rows"]
+                    graph = self._read_ann_graph(saved.get("ann"), len(rows))
+            if rows is None:
+                # Only store_papers() writes the map; readers rebuild it in memory
+                rows = build_paper_rows(self.persist_path)
+
+            self.vectors, self.rows, self._ann_graph = vectors, rows, graph
+            self._snapshot, self._ann, self._mtime = None, None, mtime
+
+    def _read_ann_graph(self, name: Optional[str], n_papers: int) -> Optional[faiss.Index]:
+        """The saved HNSW graph over the papers of paper_rows.json, or None (exact search)."""
+        if not name:
+            return None
+        try:
+            graph = faiss.read_index(os.path.join(self.persist_path, name))
+        except RuntimeError:
+            # Replaced by a newer store_papers() meanwhile; the next refresh picks that up
+            return None
+        return graph if graph.ntotal == n_papers else None
+
+    def get(self, paper_id: str) -> np.ndarray:
+        """The stored vector of one paper; ValueError if it is not in the store."""
+        self._refresh()
+        row = self.rows.get(paper_id)
+        if row is None:
+            raise ValueError(f"Paper with ID {paper_id} not found in FAISS index.")
+        return self.vectors[row].copy()
+
+    def get_many(self, paper_ids: List[str]) -> Dict[str, np.ndarray]:
+        """{paper_id: vector} for the ids that are in the store (one fancy-indexed copy)."""
+        self._refresh()
+        found = [pid for pid in dict.fromkeys(paper_ids) if pid in self.rows]
+        vectors = self.vectors[[self.rows[pid] for pid in found]]
+        return dict(zip(found, vectors))
+
+    def snapshot(self) -> Tuple[List[str], np.ndarray]:
+        """(paper_ids, their vectors as one matrix) for every stored paper, built once per index version."""
+        self._refresh()
+        snapshot = self._snapshot
+        if snapshot is None:
+            paper_ids = list(self.rows)
+            snapshot = (paper_ids, self.vectors[[self.rows[pid] for pid in paper_ids]])
+            self._snapshot = snapshot
+        return snapshot
+
+    def unit_snapshot(self) -> Tuple[List[str], np.ndarray]:
+        """(paper_ids, their L2-normalised vectors) for every stored paper, built once per index version."""
+        paper_ids, _, unit, _ = self._ann_index()
+        return paper_ids, unit
+
+    def _ann_index(self):
+        """
+        (paper_ids, id -> position, unit vectors, saved HNSW inner-product
+        index or None) over the snapshot, built once per index version.
+        """
+        paper_ids, vectors = self.snapshot()
+        ann = self._ann
+        if ann is None or ann[0] is not paper_ids:
+            ann = (paper_ids, {pid: i for i, pid in enumerate(paper_ids)}, _unit_rows(vectors), self._ann_graph)
+            self._ann = ann
+        return ann
+
+    def search(self, query: np.ndarray, top_k: int = 20, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """
+        Cosine top-k over every stored paper, skipping the `exclude` ids:
+        [(paper_id, cosine)], best first.
+
+        Past EXACT_SEARCH_PAPERS papers this uses the HNSW graph saved by
+        store_papers() (sublinear in the corpus size) with the excluded papers
+        filtered inside the graph search; smaller corpora, a store without a
+        graph, or a filter that leaves the graph search short of top_k
+        results, are scored exactly.
+        """
+        paper_ids, positions, unit, index = self._ann_index()
+        if not paper_ids or top_k <= 0:
+            return []
+
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        query = query / max(float(np.linalg.norm(query)), 1e-8)
+        excluded = np.array(sorted({positions[pid] for pid in exclude if pid in positions}), dtype=np.int64)
+        k = min(top_k, len(paper_ids) - len(excluded))
+        if k <= 0:
+            return []
+
+        hits = []
+        if index is not None:
+            params = faiss.SearchParametersHNSW(efSearch=max(HNSW_EF_SEARCH, 2 * k))
+            if len(excluded):
+                params.sel = faiss.IDSelectorNot(faiss.IDSelectorBatch(excluded))
+            scores, labels = index.search(query, k, params=params)
+            hits = [(paper_ids[label], float(score)) for label, score in zip(labels[0], scores[0]) if label >= 0]
+
+        if len(hits) < k:
+            exact = unit @ query[0]
+            exact[excluded] = -np.inf
+            order = np.argpartition(-exact, k - 1)[:k]
+            order = order[np.argsort(-exact[order], kind="stable")]
+            hits = [(paper_ids[i], float(exact[i])) for i in order]
+        return hits
+
+    def __contains__(self, paper_id: str) -> bool:
+        self._refresh()
+        return paper_id in self.rows
+
+
+_lookups: Dict[str, PaperEmbeddingLookup] = {}
+_lookups_lock = threading.Lock()
+
+
+def get_paper_lookup(persist_path: str = DEFAULT_PERSIST_PATH) -> PaperEmbeddingLookup:
+    """Process-wide PaperEmbeddingLookup per store path."""
+    with _lookups_lock:
+        if persist_path not in _lookups:
+            _lookups[persist_path] = PaperEmbeddingLookup(persist_path)
+        return _lookups[persist_path]
+
+
 class PaperVectorStore:
-    def __init__(self, persist_path: str = "faiss_index/faiss_index",
+    def __init__(self, persist_path: str = DEFAULT_PERSIST_PATH,
                  embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
         """
         Wrapper around FAISS for storing and searching paper embeddings.
@@ -64,8 +301,19 @@ class PaperVectorStore:
         
         # Persist index to disk using FAISS save_local method
         self.vectorstore.save_local(self.persist_path)
+        self._save_paper_rows()
         return f"Stored {len(docs)} papers in FAISS index"
 
+    def _save_paper_rows(self):
+        """Write the paper_id -> row map and the HNSW graph used by PaperEmbeddingLookup."""
+        rows = _paper_rows(self.vectorstore.docstore, self.vectorstore.index_to_docstore_id)
+        ntotal = self.vectorstore.index.ntotal
+        ids = np.fromiter(rows.values(), dtype=np.int64, count=len(rows))
+        vectors = self.vectorstore.index.reconstruct_batch(ids) if len(ids) else np.empty((0, self.vectorstore.index.d), dtype=np.float32)
+        ann = _write_ann_index(self.persist_path, _unit_rows(vectors), ntotal)
+        _write_paper_rows(self.persist_path, rows, ntotal, ann)
+        _remove_stale_ann_indexes(self.persist_path, ann)
+
     def similarity_search(self, query: str, k: int = 5):
         """
         Perform similarity search against stored papers.
@@ -1,59 +1,230 @@
-from typing import List 
-from flair.models import SequenceTagger
-from flair.data import Sentence
-from flair.splitter import SegtokSentenceSplitter
+import os
+import re
+from typing import List, Iterable, Iterator, Tuple, Union
+
+
+DEFAULT_TOKENIZER = "BAAI/bge-small-en-v1.5"
+STRATEGIES = ("words", "sentences", "tokens")
+DEFAULT_STRATEGY = os.getenv("CHUNKING_STRATEGY", "words")
+
+# Fallback sentence boundary when segtok is not installed (skips common paper abbreviations)
+_SENTENCE_END = re.compile(
+    r"(?<!\bDr\.)(?<!\bFig\.)(?<!\bEq\.)(?<!\bal\.)(?<!\bvs\.)(?<!\be\.g\.)(?<!\bi\.e\.)"
+    r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\n\s*\n"
+)
+
 
 class TextChunker : 
     """
         Splits extracted text into chunks for embedding
+
+        chunk() applies the configured `strategy` (CHUNKING_STRATEGY env var):
+        - "words": chunk_text(), `chunk_size` words with `overlap` words.
+        - "sentences": chunk_sentences(), whole sentences up to `chunk_size` words.
+        - "tokens": chunk_tokens(), cut on the embedder's tokenizer so every
+          chunk fits its `max_tokens` window (special tokens included) with
+          `token_overlap` tokens of overlap.
+
+        iter_chunks() yields the same chunks from a text file or an iterable of
+        pages, reading them incrementally.
     """
     
-    def __init__(self , chunk_size:int=500 , overlap:int=50):
+    def __init__(self , chunk_size:int=500 , overlap:int=50 , tokenizer=None , max_tokens:int=512 , token_overlap:int=32 , strategy:str=DEFAULT_STRATEGY):
         
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, got {strategy!r}")
+        self.strategy = strategy
         self.chunk_size = chunk_size
         self.overlap = overlap 
+        self.max_tokens = max_tokens
+        self.token_overlap = token_overlap
+        # A (fast) tokenizer or a model name, loaded on first chunk_tokens() call
+        self._tokenizer = tokenizer
         
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None or isinstance(self._tokenizer, str):
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self._tokenizer or DEFAULT_TOKENIZER)
+        return self._tokenizer
+
+    def chunk(self , text:str) -> List[str] :
+        """Split text with the configured strategy"""
+        if self.strategy == "sentences":
+            return self.chunk_sentences(text)
+        if self.strategy == "tokens":
+            return self.chunk_tokens(text)
+        return self.chunk_text(text)
+
         
     def chunk_text(self , text:str) -> List[str] : 
         """Split text into overlappings chunks"""
         
-        words = text.split()
-        
-        chunks = []
-        start = 0 
-        
-        
-        while start < len(words) : 
-            end = start+ self.chunk_size
-            chunk = " ".join(words[start:end])
-            
-            chunks.append(chunk)
-            start += self.chunk_size - self.overlap 
-            
-        return chunks
-    def semantic_splitter(self , text: str) -> List[str]:
-
-
-        splitter = SegtokSentenceSplitter()
-        
-        # Split text into sentences
-        sentences = splitter.split(text)
+        return list(self._word_windows(text.split()))
+
+    def _word_windows(self , words:Iterable[str]) -> Iterator[str] :
+        """`chunk_size`-word windows every `chunk_size - overlap` words, over a word stream"""
+        step = self.chunk_size - self.overlap
+        window: List[str] = []
+        for word in words:
+            window.append(word)
+            if len(window) == self.chunk_size:
+                yield " ".join(window)
+                del window[:step]
+        if window:
+            yield " ".join(window)
+
+    def chunk_tokens(self , text:str) -> List[str] :
+        """
+        Split text into chunks of at most `max_tokens` model tokens.
 
-        chunks = []
-        current_chunk = ""
+        The text is tokenized once; windows are cut on token positions and
+        mapped back to character spans through the offsets, so a chunk is a
+        slice of the original text (no re-joining). Window edges are moved to
+        word boundaries so re-tokenizing a chunk gives the same tokens.
+        """
+        return [text[start:end] for start, end in self._token_spans(text)]
+
+    def _token_spans(self , text:str) -> List[Tuple[int, int]] :
+        """Character spans of the chunk_tokens() windows"""
+        tokenizer = self.tokenizer
+        if not tokenizer.is_fast:
+            raise ValueError("chunk_tokens() needs a fast tokenizer (offset mapping)")
+
+        window = self.max_tokens - tokenizer.num_special_tokens_to_add()
+        if not 0 <= self.token_overlap < window:
+            raise ValueError(f"token_overlap must be in [0, {window}), got {self.token_overlap}")
+
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        offsets = encoding["offset_mapping"]
+        word_ids = encoding.word_ids()
+        n_tokens = len(offsets)
+
+        spans = []
+        start = 0
+        while start < n_tokens :
+            end = min(start + window, n_tokens)
+            # Don't cut inside a word (unless the word alone fills the window)
+            while end < n_tokens and end > start + 1 and word_ids[end] == word_ids[end - 1]:
+                end -= 1
+            if end < n_tokens and end == start + 1:
+                end = min(start + window, n_tokens)
+
+            spans.append((offsets[start][0], offsets[end - 1][1]))
+            if end == n_tokens:
+                break
+
+            next_start = max(end - self.token_overlap, start + 1)
+            while next_start < end and word_ids[next_start] == word_ids[next_start - 1]:
+                next_start += 1
+            start = next_start
+
+        return spans
+
+    @staticmethod
+    def split_sentences(text:str) -> List[str] :
+        """Sentence split with segtok (imported on first use), or a regex if it is missing"""
+        try:
+            from segtok.segmenter import split_multi
+        except ImportError:
+            return [sentence for sentence in _SENTENCE_END.split(text) if sentence and sentence.strip()]
+        return [sentence for sentence in split_multi(text) if sentence.strip()]
+
+    def chunk_sentences(self , text:str) -> List[str] :
+        """Pack whole sentences into chunks of at most `chunk_size` words"""
+        return list(self._pack_sentences(self.split_sentences(text)))
+
+    def _pack_sentences(self , sentences:Iterable[str]) -> Iterator[str] :
+        current: List[str] = []
+        current_words = 0
 
         for sentence in sentences:
-            # Add sentence to the current chunk
-            if len(current_chunk) + len(sentence.to_plain_string()) <= self.chunk_size:
-                current_chunk += " " + sentence.to_plain_string()
-            else:
-                # If adding the next sentence exceeds max size, start a new chunk
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence.to_plain_string()
+            words = sentence.split()
+            if current and current_words + len(words) > self.chunk_size:
+                yield " ".join(current)
+                current, current_words = [], 0
+            if len(words) > self.chunk_size:
+                # A single over-long "sentence" (tables, references) falls back to word windows
+                yield from self._word_windows(words)
+                continue
+            current.extend(words)
+            current_words += len(words)
+
+        if current:
+            yield " ".join(current)
+
+    # ======================
+    # Streaming
+    # ======================
+    def iter_chunks(self , source:Union[str, os.PathLike, Iterable[str]] , block_chars:int=1 << 16) -> Iterator[str] :
+        """
+        Yield the chunks of a text file (path) or of an iterable of text
+        pieces (e.g. pages), with the configured strategy, without holding
+        the whole text.
+
+        Word windows are cut straight from the word stream. Sentence and token
+        chunking work on blocks of about `block_chars` characters; the last
+        (possibly unfinished) sentence / token window of a block is carried
+        into the next one, so the chunks are the same as chunk() on the full
+        text, up to the sentence splitter.
+        """
+        pieces = self._read_pieces(source)
+        if self.strategy == "sentences":
+            yield from self._pack_sentences(self._stream_sentences(self._blocks(pieces, block_chars), block_chars))
+        elif self.strategy == "tokens":
+            yield from self._stream_token_chunks(self._blocks(pieces, block_chars))
+        else:
+            yield from self._word_windows(word for piece in pieces for word in piece.split())
+
+    @staticmethod
+    def _read_pieces(source) -> Iterator[str] :
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "r", encoding="utf-8") as f:
+                yield from f
+            return
+        for piece in source:
+            # Page ends are word (and paragraph) boundaries
+            yield piece if piece.endswith("\n") else piece + "\n"
 
-        # Add the last chunk if it exists
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+    @staticmethod
+    def _blocks(pieces:Iterable[str] , block_chars:int) -> Iterator[str] :
+        """Concatenate pieces into blocks of at least `block_chars` characters"""
+        block: List[str] = []
+        size = 0
+        for piece in pieces:
+            block.append(piece)
+            size += len(piece)
+            if size >= block_chars:
+                yield "".join(block)
+                block, size = [], 0
+        if block:
+            yield "".join(block)
 
-        return chunks
+    def _stream_sentences(self , blocks:Iterable[str] , block_chars:int) -> Iterator[str] :
+        carry = ""
+        for block in blocks:
+            sentences = self.split_sentences(carry + block)
+            # The last sentence may go on in the next block
+            carry = sentences.pop() + " " if sentences else ""
+            yield from sentences
+            if len(carry) > block_chars:
+                # No sentence boundary in sight: don't let the carry grow unbounded
+                yield carry
+                carry = ""
+        if carry.strip():
+            yield carry
 
+    def _stream_token_chunks(self , blocks:Iterable[str]) -> Iterator[str] :
+        carry = ""
+        for block in blocks:
+            text = carry + block
+            spans = self._token_spans(text)
+            if len(spans) < 2:
+                carry = text
+                continue
+            # The last window may go on in the next block: re-cut it from its start
+            for start, end in spans[:-1]:
+                yield text[start:end]
+            carry = text[spans[-1][0]:]
+        for start, end in self._token_spans(carry):
+            yield carry[start:end]
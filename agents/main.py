@@ -1,6 +1,6 @@
 from typing import List, Dict
 from agents.system_agents.crawler import run_agent
-from agents.data.embedding import handle_paper_interaction , get_paper_recommendations , MultimodalEmbedder
+from agents.data.embedding import handle_paper_interaction , get_paper_recommendations , get_embedder
 from agents.data.vector_db import PaperVectorStore
 from agents.data.indexing import FAISSIndex
 from agents.lib.chunker import TextChunker
@@ -60,11 +60,9 @@ def main(user_id:str , thread_id:str=None):
     with open(text_file, "r", encoding="utf-8") as f:
         raw_text = f.read()
         
-    chunker = TextChunker(chunk_size=400    , overlap=10)
-    text_chunks = chunker.semantic_splitter(raw_text) 
-    embedder = MultimodalEmbedder()
-    
-    text_chunks = chunker.chunk_text(raw_text) 
+    embedder = get_embedder()
+    chunker = TextChunker(chunk_size=400    , overlap=10 , tokenizer=embedder.text_tokenizer)
+    text_chunks = chunker.chunk(raw_text) 
     text_embs = embedder.embed_text(text_chunks)
     text_meta = [{"chunk_type": "text", "chunk": i, "content": c , "paper_id": "http://arxiv.org/abs/2509.09680v1"} for i, c in enumerate(text_chunks)]
     print("[Info] Done with text embedding")
@@ -74,12 +72,12 @@ def main(user_id:str , thread_id:str=None):
     print("[Info] Done with images embeddings")
     # Store
     # Text index
-    text_index = FAISSIndex(dim=len(text_embs[0]), index_path="faiss_index/text_index.faiss")
+    text_index = FAISSIndex.open(dim=len(text_embs[0]), index_path="faiss_index/text_index.faiss")
     text_index.add_embeddings(text_embs, text_meta)
     text_index.save()
 
     # Image index
-    image_index = FAISSIndex(dim=len(image_embs[0]), index_path="faiss_index/image_index.faiss")
+    image_index = FAISSIndex.open(dim=len(image_embs[0]), index_path="faiss_index/image_index.faiss")
     image_index.add_embeddings(image_embs, image_meta)
     image_index.save()
     
@@ -94,8 +92,8 @@ def main(user_id:str , thread_id:str=None):
     # --- Step 3: encode query in both spaces ---
     query = "World models and vision models"
 
-    query_text_emb = np.array(embedder.embed_text([query])).astype("float32")
-    query_clip_emb = np.array(embedder.embed_text_using_clip([query])).astype("float32")
+    query_text_emb = np.array(embedder.embed_text([query], cache=False)).astype("float32")
+    query_clip_emb = np.array(embedder.embed_text_using_clip([query], cache=False)).astype("float32")
 
     # --- Step 4: search ---
     text_results = text_index.search(query_text_emb[0], top_k=3)
@@ -9,8 +9,10 @@ from PIL import Image
 from io import BytesIO
 from agents.prompts.agents_prompts import PAPER_RAG_PROMPT
 from langchain_google_genai import ChatGoogleGenerativeAI 
-from agents.data.indexing import FAISSIndex
-from agents.data.embedding import MultimodalEmbedder 
+from agents.data.sharded_index import open_index, index_exists
+from agents.data.embedding import get_embedder 
+from agents.data.embedding_batcher import get_embedding_batcher
+from agents.data.embedding_cache import query_embedding_cache
 import numpy as np 
 from langchain_core.runnables.config import RunnableConfig
 
@@ -85,22 +87,33 @@ class ScientificPaperRetriever:
         text_index_path = "faiss_index/text_index.faiss"
         image_index_path = "faiss_index/image_index.faiss"
         
-        if not os.path.exists(text_index_path):
+        if not index_exists(text_index_path):
             raise FileNotFoundError(f"Text index not found: {text_index_path}")
-        if not os.path.exists(image_index_path):
+        if not index_exists(image_index_path):
             raise FileNotFoundError(f"Image index not found: {image_index_path}")
             
-        self.text_index = FAISSIndex(dim=self.text_emb_size, index_path=text_index_path)
-        self.images_index = FAISSIndex(dim=self.image_emb_size, index_path=image_index_path)
-        
-        self.text_index.load()
-        self.images_index.load()
-        self.embedder = MultimodalEmbedder()
+        # Serving only searches: map the index files so workers share them.
+        # Plain and sharded layouts expose the same search interface.
+        self.text_index = open_index(dim=self.text_emb_size, index_path=text_index_path, read_only=True)
+        self.images_index = open_index(dim=self.image_emb_size, index_path=image_index_path, read_only=True)
+        self.embedder = get_embedder()
+        # Concurrent chat requests share forward passes for their query embeddings
+        self.batcher = get_embedding_batcher()
     
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """BGE query embeddings, through the process-wide query cache."""
+        return query_embedding_cache.embed(self.embedder.text_key, queries, self.batcher.embed_text)
+
+    def _embed_queries_clip(self, queries: List[str]) -> List[List[float]]:
+        """CLIP text embeddings of the queries, through the process-wide query cache."""
+        return query_embedding_cache.embed(
+            self.embedder.clip_text_key, queries, self.batcher.embed_text_using_clip
+        )
+
     def retrieve_text_context(self, query: str, top_k: int = 5) -> List[Document]:
         """Retrieve relevant text passages from scientific papers"""
         try:
-            query_text_emb = np.array(self.embedder.embed_text([query])).astype("float32") 
+            query_text_emb = np.array(self._embed_queries([query])).astype("float32") 
             text_results = self.text_index.search(query_text_emb[0], top_k , paper_id=self.paper_id) 
             
             # Convert to Document objects
@@ -124,7 +137,7 @@ class ScientificPaperRetriever:
     def retrieve_images(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """Retrieve relevant images from scientific papers"""
         try:
-            query_clip_emb = np.array(self.embedder.embed_text_using_clip([query])).astype("float32") 
+            query_clip_emb = np.array(self._embed_queries_clip([query])).astype("float32") 
             image_results = self.images_index.search(query_clip_emb[0], top_k , paper_id=self.paper_id)
             
             valid_results = []
@@ -147,31 +160,60 @@ class ScientificPaperRetriever:
             # Retrieve images
             image_results = self.retrieve_images(query, image_top_k)
             
-            # Convert images to base64
-            image_base64_data = []
-            
-            for result in image_results:
-                # Extract filename/path from result
-                image_path = result.get('filename') or result.get('path') or result.get('content')
-                
-                if image_path:
-                    base64_data = self.image_processor.get_image_base64(image_path)
-                    if base64_data and self.image_processor.validate_image(base64_data):
-                        image_base64_data.append(base64_data)
-                    else:
-                        logger.warning(f"Failed to process image: {image_path}")
-                else:
-                    logger.warning(f"No valid image path in result: {result}")
-            
             return RetrievalResult(
                 text_documents=text_docs,
-                image_base64_data=image_base64_data,
+                image_base64_data=self._images_to_base64(image_results),
             )
             
         except Exception as e:
             logger.error(f"Error in retrieval: {e}")
             return RetrievalResult([], [])
 
+    def retrieve_all_batch(self, queries: List[str], text_top_k: int = 5, image_top_k: int = 3) -> List[RetrievalResult]:
+        """Retrieve text and images for several questions with one embedding and one search call per modality"""
+        try:
+            query_text_embs = np.array(self._embed_queries(queries)).astype("float32")
+            query_clip_embs = np.array(self._embed_queries_clip(queries)).astype("float32")
+
+            text_results = self.text_index.search_batch(query_text_embs, text_top_k, paper_ids=self.paper_id)
+            image_results = self.images_index.search_batch(query_clip_embs, image_top_k, paper_ids=self.paper_id)
+
+            results = []
+            for texts, images in zip(text_results, image_results):
+                text_docs = [
+                    Document(page_content=r['content'], metadata=r.get('metadata', {}))
+                    for r in texts if 'content' in r
+                ]
+                valid_images = [r for r in images if r.get("score", 0) > 0.5]
+                results.append(RetrievalResult(
+                    text_documents=text_docs,
+                    image_base64_data=self._images_to_base64(valid_images),
+                ))
+            return results
+
+        except Exception as e:
+            logger.error(f"Error in batch retrieval: {e}")
+            return [RetrievalResult([], []) for _ in queries]
+
+    def _images_to_base64(self, image_results: List[Dict[str, Any]]) -> List[str]:
+        """Convert image search results to validated base64 data URLs"""
+        image_base64_data = []
+
+        for result in image_results:
+            # Extract filename/path from result
+            image_path = result.get('filename') or result.get('path') or result.get('content')
+
+            if image_path:
+                base64_data = self.image_processor.get_image_base64(image_path)
+                if base64_data and self.image_processor.validate_image(base64_data):
+                    image_base64_data.append(base64_data)
+                else:
+                    logger.warning(f"Failed to process image: {image_path}")
+            else:
+                logger.warning(f"No valid image path in result: {result}")
+
+        return image_base64_data
+
 
 # =============================
 # RAG using Gemini 
@@ -12,38 +12,65 @@ import uuid
 from backend.app.models.user import User
 from backend.app.routes.papers_api import process_paper
 from apscheduler.schedulers.background import BackgroundScheduler
-from agents.data.indexing import FAISSIndex
+from agents.data.sharded_index import open_index
 from agents.lib.chunker import TextChunker
-from agents.data.embedding import MultimodalEmbedder
+from agents.data.embedding import get_embedder
+from backend.app.services.feed_service import refresh_all_feeds
+from backend.app.services.interaction_queue import InteractionWorker, get_interaction_queue
 import os
 import datetime
-
-def papers_index(text_file , images , paper_id) : 
-    with open(text_file, "r", encoding="utf-8") as f:
-        raw_text = f.read()
-    chunker = TextChunker(chunk_size=400    , overlap=10)
-    text_chunks = chunker.semantic_splitter(raw_text) 
-    embedder = MultimodalEmbedder()
-    text_chunks = chunker.chunk_text(raw_text) 
-    text_embs = embedder.embed_text(text_chunks)
-    text_meta = [{"chunk_type": "text", "chunk": i, "content": c , "paper_id": paper_id} for i, c in enumerate(text_chunks)]
+from itertools import islice
+import numpy as np
+
+# Number of shard files per modality for a new index (1 = single file)
+INDEX_SHARDS = int(os.getenv("FAISS_INDEX_SHARDS", "1"))
+# Chunks handed to the embedder at a time while indexing a paper
+EMBED_CHUNK_BATCH = 256
+
+def open_paper_indexes():
+    """Open the text / image indexes once so each paper only appends a segment."""
+    text_index = open_index(dim=384, index_path="faiss_index/text_index.faiss", n_shards=INDEX_SHARDS)
+    image_index = open_index(dim=512, index_path="faiss_index/image_index.faiss", n_shards=INDEX_SHARDS)
+    return text_index, image_index
+
+def papers_index(text_file , images , paper_id , text_index=None , image_index=None , categories=None , published=None) : 
+    if text_index is None or image_index is None:
+        text_index, image_index = open_paper_indexes()
+    embedder = get_embedder()
+    # Strategy from CHUNKING_STRATEGY; token mode reuses the embedder's tokenizer
+    chunker = TextChunker(chunk_size=400    , overlap=10 , tokenizer=embedder.text_tokenizer)
+    # Paper-level attributes, used by filtered search (category / date)
+    paper_attrs = {"categories": categories, "published": published}
+    # Text index (re-processing a paper replaces its chunks instead of duplicating them).
+    # The text file is streamed: each batch of chunks is embedded and added to the
+    # index, so neither the chunks nor their embeddings pile up here. The old
+    # chunks are only dropped once every batch is in.
+    def text_batches():
+        chunks = chunker.iter_chunks(text_file)
+        n_chunks = 0
+        while True:
+            batch = list(islice(chunks, EMBED_CHUNK_BATCH))
+            if not batch:
+                return
+            batch_embs = np.asarray(embedder.embed_text(batch), dtype=np.float32)
+            yield batch_embs, [{"chunk_type": "text", "chunk": n_chunks + i, "content": c, **paper_attrs} for i, c in enumerate(batch)]
+            n_chunks += len(batch)
+
+    text_index.replace_paper(paper_id, text_batches())
+    text_index.save()
     print("[Info] Done with text embedding")
     image_embs = embedder.embed_images(images)
-    image_meta = [{"chunk_type": "image", "path": p , "paper_id": paper_id} for p in images]
-    # Text index
-    text_index = FAISSIndex(dim=len(text_embs[0]), index_path="faiss_index/text_index.faiss")
-    text_index.add_embeddings(text_embs, text_meta)
-    text_index.save()
+    image_meta = [{"chunk_type": "image", "path": p , "paper_id": paper_id, **paper_attrs} for p in images]
 
     # Image index
-    image_index = FAISSIndex(dim=len(image_embs[0]), index_path="faiss_index/image_index.faiss")
-    image_index.add_embeddings(image_embs, image_meta)
+    image_index.upsert_paper(paper_id, image_embs, image_meta)
     image_index.save()
     print("[Info] Done with images embeddings")
 def crawl_and_store():
     with get_db() as db:
         users = db.query(User).all()
         paper_store = PaperVectorStore()
+        text_index, image_index = open_paper_indexes()
 
         for user in users:
 
@@ -59,7 +86,9 @@ def crawl_and_store():
                     arxiv_id = url.split("/")[-1]
                     results = process_paper(arxiv_id)
                     if results : 
-                        papers_index(text_file=results["text_file"] ,images = results["images"], paper_id=paper["id"] )
+                        papers_index(text_file=results["text_file"] ,images = results["images"], paper_id=paper["id"] ,
+                                     text_index=text_index , image_index=image_index ,
+                                     categories=paper.get("categories") , published=paper.get("published"))
                         insert_paper(
                                 db,
                                 id=paper["id"], 
@@ -72,6 +101,9 @@ def crawl_and_store():
                                 published_at=date.today()
                             )
 
+        # New papers change every ranking: re-materialize all user feeds
+        refresh_all_feeds(db)
+
   
 def create_app():
     app = Flask(__name__)
@@ -93,6 +125,9 @@ def create_app():
     scheduler = BackgroundScheduler()
     scheduler.add_job(func=crawl_and_store, trigger="interval", days=1 , next_run_time=datetime.datetime.now())
     scheduler.start()
+
+    # --- Interaction events -> batched user embedding updates ---
+    InteractionWorker(get_interaction_queue()).start()
     
 
     return app
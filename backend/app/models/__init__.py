@@ -3,3 +3,4 @@ from .user_preferences import UserPreferences
 from .user_embedding import UserEmbedding
 from .user_feedback import UserFeedback
 from .paper import Paper
+from .user_feed import UserFeed
@@ -14,6 +14,7 @@ class User(Base):
     # Relationships
     preferences = relationship("UserPreferences", back_populates="user", uselist=False)
     embedding = relationship("UserEmbedding", back_populates="user", uselist=False)
+    feed = relationship("UserFeed", back_populates="user", uselist=False)
     feedback = relationship("UserFeedback", back_populates="user")
     papers = relationship("Paper" , back_populates="user")
     chat_history = relationship("ChatHistory" , back_populates="user")
\ No newline at end of file
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Float, String
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import ARRAY
+from backend.app.database import Base
+
+
+class UserFeed(Base):
+    """Precomputed ranked feed of a user: one row, paper ids and scores best first."""
+    __tablename__ = "user_feed"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    paper_ids = Column(ARRAY(String), nullable=False)
+    scores = Column(ARRAY(Float), nullable=False)
+    # User embedding the feed was ranked with, to detect drift
+    embedding = Column(ARRAY(Float))
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    user = relationship("User", back_populates="feed")
@@ -9,7 +9,7 @@ from datetime import date
 from werkzeug.utils import secure_filename
 
 from agents.system_agents.crawler import run_agent
-from agents.data.embedding import handle_paper_interaction, get_paper_recommendations, MultimodalEmbedder
+from agents.data.embedding import handle_paper_interaction, get_paper_recommendations
 from agents.data.vector_db import PaperVectorStore
 from agents.data.indexing import FAISSIndex
 from agents.lib.chunker import TextChunker
@@ -22,16 +22,8 @@ from backend.app.models.paper import Paper
 paper_bp = Blueprint("paper_api", __name__, url_prefix="/api/papers")
 
 # Initialize components
-embedder_instance = None
 text_chunker = TextChunker(chunk_size=400, overlap=10)
 
-def get_embedder():
-    """Get or create embedder instance"""
-    global embedder_instance
-    if embedder_instance is None:
-        embedder_instance = MultimodalEmbedder()
-    return embedder_instance
-
 # ======================
 # Health Check
 # ======================
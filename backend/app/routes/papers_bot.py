@@ -7,7 +7,7 @@ from werkzeug.exceptions import BadRequest
 
 # Import your modules
 from agents.system_agents.crawler import run_agent
-from agents.data.embedding import handle_paper_interaction, get_paper_recommendations, MultimodalEmbedder
+from agents.data.embedding import handle_paper_interaction, get_paper_recommendations
 from agents.data.vector_db import PaperVectorStore
 from agents.data.indexing import FAISSIndex
 from agents.lib.chunker import TextChunker
@@ -18,16 +18,8 @@ from backend.app.services.db_service import get_db, insert_chat_history
 papers_bot_bp = Blueprint("papers_bot", __name__, url_prefix="/api/bot")
 
 # Initialize components
-embedder_instance = None
 text_chunker = TextChunker(chunk_size=400, overlap=10)
 
-def get_embedder():
-    """Get or create embedder instance"""
-    global embedder_instance
-    if embedder_instance is None:
-        embedder_instance = MultimodalEmbedder()
-    return embedder_instance
-
 # ====================
 # Papers bot endpoint
 # ====================
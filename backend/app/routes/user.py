@@ -1,11 +1,13 @@
 from flask import Blueprint, request, jsonify
-from agents.data.embedding import handle_paper_interaction, get_paper_recommendations 
+from agents.data.embedding import get_paper_recommendations, discover_papers
 from backend.app.auth.auth_utils import hash_password, verify_password
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from sqlalchemy.orm import Session
 from backend.app.database import SessionLocal
 from backend.app.models import User
 from backend.app.services.db_service import update_paper_like , get_db
+from backend.app.services.feed_service import get_feed_page
+from backend.app.services.interaction_queue import get_interaction_queue
 # Create Blueprint
 user_bp = Blueprint("user_api", __name__, url_prefix="/api/user")
 
@@ -15,16 +17,28 @@ user_bp = Blueprint("user_api", __name__, url_prefix="/api/user")
 @user_bp.route('/recommendations', methods=['POST'])
 @jwt_required()
 def get_recommendations():
-    """Get paper recommendations for a user"""
+    """
+    Get paper recommendations for a user: rank the posted `papers`, or with
+    "mode": "discover" search the whole paper corpus for unseen papers.
+    """
     try:
         data = request.get_json()
         papers = data.get('papers', [])
         user_id = data.get("user_id", "")
+        top_k = data.get("top_k")
+        mode = data.get("mode", "rank")
         
-        if not papers:
+        if mode not in ("rank", "discover"):
+            return jsonify({"error": "mode must be 'rank' or 'discover'"}), 400
+        if mode == "rank" and not papers:
             return jsonify({"error": "papers array is required"}), 400
+        if top_k is not None and (not isinstance(top_k, int) or top_k < 1):
+            return jsonify({"error": "top_k must be a positive integer"}), 400
         
-        recommendations = get_paper_recommendations(user_id, papers)
+        if mode == "discover":
+            recommendations = discover_papers(user_id, top_k=top_k or 20)
+        else:
+            recommendations = get_paper_recommendations(user_id, papers, top_k=top_k)
         
         return jsonify({
             "success": True,
@@ -36,6 +50,34 @@ def get_recommendations():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# =====================
+# Materialized feed endpoint
+# =====================
+@user_bp.route('/feed', methods=['GET'])
+@jwt_required()
+def get_feed():
+    """Page through the user's precomputed feed (refreshed after each crawl)"""
+    try:
+        user_id = request.args.get("user_id", "")
+        offset = request.args.get("offset", 0, type=int)
+        limit = request.args.get("limit", 20, type=int)
+
+        if not user_id:
+            return jsonify({"error": "user_id is required"}), 400
+        if offset < 0 or not 1 <= limit <= 100:
+            return jsonify({"error": "offset must be >= 0 and limit between 1 and 100"}), 400
+
+        with get_db() as db:
+            page = get_feed_page(db, user_id, offset=offset, limit=limit)
+
+        if page is None:
+            return jsonify({"error": f"No feed computed yet for user {user_id}"}), 404
+
+        return jsonify({"success": True, "user_id": user_id, **page})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # ===========================
 # Interact with paper endpoint 
 # ===========================
@@ -64,15 +106,20 @@ def paper_interaction():
         if interaction not in ["LIKE", "DISLIKE"]:
             return jsonify({"error": "interaction must be 'LIKE' or 'DISLIKE'"}), 400
         
-        handle_paper_interaction(user_id, paper, interaction)
+        # Embedding / preference updates are applied in batches by the interaction worker
+        event_id = get_interaction_queue().append(user_id, paper, interaction)
         
         return jsonify({
             "success": True,
             "user_id": user_id,
             "interaction": interaction,
+            "event_id": event_id,
             "message": f"Interaction '{interaction}' recorded successfully"
-        })
-    
+        }), 202
+
+    except ValueError as e:
+        # Unknown user / paper or invalid event
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -72,6 +72,13 @@ def insert_paper(db, id: str, user_id: int, title: str, abstract: str,
         # Fetch existing paper instead of failing
         return db.query(Paper).filter_by(id=id).first()
 
+def get_seen_paper_ids(db, user_id: str) -> set:
+    """
+    Ids of papers already delivered to or acted on by the user: the user's
+    rows of the papers table, on which likes are recorded (update_paper_like).
+    """
+    return {paper_id for (paper_id,) in db.query(Paper.id).filter(Paper.user_id == user_id).all()}
+
 def get_embedding(db, user_id: str):
     """Return UserEmbedding row for the given user_id, or None if not found."""
     return db.query(UserEmbedding).filter(UserEmbedding.user_id == user_id).first()
@@ -99,13 +106,14 @@ def update_user_embedding(db, user_id: str, new_paper_embedding: np.ndarray):
     
     
     
-def update_user_preferences(db: Session, user_id: int, category_updates: dict[str, float]):
+def update_user_preferences(db: Session, user_id: int, category_updates: dict[str, float], commit: bool = True):
     """
     Update user preferences (category weights) in the database.
     Args:
         db (Session): SQLAlchemy session.
         user_id (int): User ID.
         category_updates (dict[str, float]): Category -> weight delta, e.g. {"cs.CV": 1.0, "cs.AI": -0.5}.
+        commit (bool): Commit at the end; False lets a caller batch several updates in one commit.
     """
     # Ensure user preferences exist
     user_pref = db.query(UserPreferences).filter(UserPreferences.user_id == user_id).first()
@@ -166,7 +174,8 @@ def update_user_preferences(db: Session, user_id: int, category_updates: dict[st
             cat.weight /= total_weight
     
     # Final commit
-    db.commit()
+    if commit:
+        db.commit()
     
     return {c.category: c.weight for c in user_pref.categories}
 
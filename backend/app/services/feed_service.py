@@ -0,0 +1,151 @@
+import logging
+import os
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from agents.data.embedding import embedding_service
+from agents.data.vector_db import get_paper_lookup
+from backend.app.models.paper import Paper
+from backend.app.models.user_embedding import UserEmbedding
+from backend.app.models.user_feed import UserFeed
+
+
+# Papers kept per materialized feed
+FEED_SIZE = int(os.getenv("FEED_SIZE", "200"))
+# Cosine distance between the user embedding and the one the feed was ranked with
+# above which the feed is recomputed
+FEED_DRIFT_THRESHOLD = float(os.getenv("FEED_DRIFT_THRESHOLD", "0.05"))
+# Users scored per matmul when refreshing every feed
+FEED_USER_BATCH = 256
+
+logger = logging.getLogger(__name__)
+
+
+def _rank(user_embeddings: np.ndarray, size: int = FEED_SIZE) -> List[Dict[str, Any]]:
+    """Top `size` (paper_ids, scores) of the abstract store for each user embedding."""
+    # Normalised once per index version by the lookup, not on every refresh
+    paper_ids, unit_papers = get_paper_lookup().unit_snapshot()
+    if not paper_ids:
+        return [{"paper_ids": [], "scores": []} for _ in user_embeddings]
+
+    feeds = []
+    for start in range(0, len(user_embeddings), FEED_USER_BATCH):
+        users = np.asarray(user_embeddings[start:start + FEED_USER_BATCH], dtype=np.float32)
+        users = users / np.maximum(np.linalg.norm(users, axis=1, keepdims=True), 1e-8)
+        # Same (cos + 1) / 2 relevance as get_paper_relevance_scores, for a block of users at once
+        scores = (np.clip(users @ unit_papers.T, -1.0, 1.0) + 1) / 2
+        for user_scores in scores:
+            order = embedding_service.top_k_indices(user_scores, size)
+            feeds.append({
+                "paper_ids": [paper_ids[i] for i in order],
+                "scores": user_scores[order].astype(float).tolist(),
+            })
+    return feeds
+
+
+def _drift(a, b) -> float:
+    """Cosine distance between two embeddings (1.0 if either is missing)."""
+    if a is None or b is None or len(a) != len(b):
+        return 1.0
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(1 - np.dot(a, b) / denom) if denom > 1e-8 else 1.0
+
+
+def _store_feed(db: Session, user_id, embedding, feed: Dict[str, Any]):
+    row = db.query(UserFeed).filter(UserFeed.user_id == user_id).first()
+    if row is None:
+        row = UserFeed(user_id=user_id)
+        db.add(row)
+    row.paper_ids = feed["paper_ids"]
+    row.scores = feed["scores"]
+    row.embedding = list(embedding)
+
+
+def refresh_user_feed(db: Session, user_id, force: bool = False, commit: bool = True) -> bool:
+    """
+    Recompute a user's feed if their embedding drifted more than
+    FEED_DRIFT_THRESHOLD since the feed was ranked (always with `force`).
+    Returns True if the feed was recomputed.
+    """
+    user_embedding = db.query(UserEmbedding).filter(UserEmbedding.user_id == user_id).first()
+    if not user_embedding or not user_embedding.embedding:
+        return False
+
+    return refresh_feeds(db, {user_embedding.user_id: user_embedding.embedding}, force=force, commit=commit) > 0
+
+
+def refresh_feeds(db: Session, user_embeddings: Dict[int, Any], force: bool = False, commit: bool = True) -> int:
+    """
+    Recompute the feeds of the users in `user_embeddings` (user id -> current
+    embedding, which may not be committed yet) that drifted more than
+    FEED_DRIFT_THRESHOLD, all ranked together. With `commit=False` the feeds
+    are left in the caller's transaction. Returns the number recomputed.
+    """
+    if not user_embeddings:
+        return 0
+
+    feeds = {row.user_id: row for row in db.query(UserFeed).filter(UserFeed.user_id.in_(list(user_embeddings))).all()}
+    stale = [
+        user_id for user_id, embedding in user_embeddings.items()
+        if force or user_id not in feeds or _drift(feeds[user_id].embedding, embedding) >= FEED_DRIFT_THRESHOLD
+    ]
+    if not stale:
+        return 0
+
+    ranked = _rank(np.asarray([user_embeddings[user_id] for user_id in stale], dtype=np.float32))
+    for user_id, feed in zip(stale, ranked):
+        _store_feed(db, user_id, user_embeddings[user_id], feed)
+    if commit:
+        db.commit()
+    return len(stale)
+
+
+def refresh_all_feeds(db: Session) -> int:
+    """Re-rank every user's feed against the current abstract store (after a crawl)."""
+    rows = db.query(UserEmbedding).filter(UserEmbedding.embedding.isnot(None)).all()
+    rows = [row for row in rows if len(row.embedding) > 0]
+    if not rows:
+        return 0
+
+    dims = {len(row.embedding) for row in rows}
+    if len(dims) > 1:
+        logger.warning(f"User embeddings have mixed dimensions {dims}; ranking them separately")
+    for dim in dims:
+        group = [row for row in rows if len(row.embedding) == dim]
+        feeds = _rank(np.asarray([row.embedding for row in group], dtype=np.float32))
+        for row, feed in zip(group, feeds):
+            _store_feed(db, row.user_id, row.embedding, feed)
+    db.commit()
+    logger.info(f"Refreshed {len(rows)} user feeds")
+    return len(rows)
+
+
+def get_feed_page(db: Session, user_id, offset: int = 0, limit: int = 20) -> Optional[Dict[str, Any]]:
+    """One page of a user's materialized feed, with paper details when known; None if no feed yet."""
+    feed = db.query(UserFeed).filter(UserFeed.user_id == user_id).first()
+    if feed is None:
+        return None
+
+    page_ids = feed.paper_ids[offset:offset + limit]
+    page_scores = feed.scores[offset:offset + limit]
+    papers = {paper.id: paper for paper in db.query(Paper).filter(Paper.id.in_(page_ids)).all()} if page_ids else {}
+
+    items = []
+    for paper_id, score in zip(page_ids, page_scores):
+        item = {"id": paper_id, "relevance_score": score}
+        paper = papers.get(paper_id)
+        if paper is not None:
+            item.update(title=paper.title, abstract=paper.abstract, authors=paper.authors,
+                        categories=paper.categories, url=paper.url)
+        items.append(item)
+
+    return {
+        "items": items,
+        "total": len(feed.paper_ids),
+        "offset": offset,
+        "limit": limit,
+        "computed_at": feed.computed_at.isoformat() if feed.computed_at else None,
+    }
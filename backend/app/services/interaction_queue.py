@@ -0,0 +1,423 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Set
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from agents.data.embedding import InteractionType, embedding_service
+from agents.data.vector_db import get_paper_lookup
+from backend.app.models.user import User
+from backend.app.models.user_embedding import UserEmbedding
+from backend.app.services.db_service import get_db, update_user_preferences
+from backend.app.services.feed_service import refresh_feeds
+from backend.app.services.handle_interaction import user_paper_interaction
+
+
+DEFAULT_QUEUE_PATH = os.getenv("INTERACTION_QUEUE_PATH", "storage/interaction_events.sqlite")
+INTERACTIONS = {interaction.name.lower(): interaction for interaction in InteractionType}
+# Failures caused by the events themselves: they count an attempt and end in
+# the dead letter table. Anything else (database unreachable, lock timeout,
+# ...) hands the events back untouched and is retried.
+EVENT_ERRORS = (ValueError, KeyError, TypeError, IntegrityError, DataError)
+
+logger = logging.getLogger(__name__)
+
+
+class InteractionQueue:
+    """
+    Durable append-only queue of user/paper interaction events (SQLite, WAL).
+
+    The API appends an event and answers at once; workers claim batches
+    with a lease and delete them only once applied, so events survive a
+    restart and an event claimed by a worker that died is claimed again
+    after `lease_seconds`. A user's events are only leased to one worker
+    at a time.
+
+    An event that fails is retried after `retry_delay * 2**attempts` seconds,
+    so it does not hold back the events behind it; after `max_attempts`
+    failures it moves to the `dead_letter` table (with its last error) for
+    inspection, and requeue_dead_letters() puts it back once fixed.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_QUEUE_PATH,
+        lease_seconds: float = 300,
+        max_attempts: int = 8,
+        retry_delay: float = 2.0
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        # Wakes the in-process worker as soon as something is appended
+        self.appended = threading.Event()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                paper TEXT NOT NULL,
+                interaction TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dead_letter (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                paper TEXT NOT NULL,
+                interaction TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            )
+            """
+        )
+
+    def append(self, user_id: str, paper: Dict[str, Any], interaction: str) -> int:
+        """Validate and persist one interaction; returns its event id."""
+        if not user_id or not paper or not interaction:
+            raise ValueError("Missing required parameters")
+        if not paper.get("id"):
+            raise ValueError("Paper ID is required")
+        if interaction.lower() not in INTERACTIONS:
+            raise ValueError(f"Invalid interaction type: {interaction}")
+        if not str(user_id).isdigit():
+            raise ValueError(f"Invalid user id: {user_id}")
+        # The worker would only fail on the user_embedding / preferences foreign keys
+        with get_db() as db:
+            if db.query(User.id).filter(User.id == int(user_id)).first() is None:
+                raise ValueError(f"User not found: {user_id}")
+
+        # Only what the worker needs: the id (embedding) and categories (preferences)
+        payload = json.dumps({"id": paper["id"], "categories": paper.get("categories") or []})
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO events (user_id, paper, interaction, created_at) VALUES (?, ?, ?, ?)",
+                (str(user_id), payload, interaction.lower(), time.time()),
+            )
+        self.appended.set()
+        return cursor.lastrowid
+
+    def claim(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Lease up to `limit` pending events (oldest first, skipping those waiting for a retry).
+
+        Users with events leased by another worker are skipped, so concurrent
+        workers never read-modify-write the same user's embedding.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                UPDATE events SET claimed_at = ?
+                WHERE id IN (
+                    SELECT id FROM events
+                    WHERE (claimed_at IS NULL OR claimed_at < ?) AND available_at <= ?
+                        AND user_id NOT IN (SELECT user_id FROM events WHERE claimed_at >= ?)
+                    ORDER BY id LIMIT ?
+                )
+                RETURNING id, user_id, paper, interaction, created_at, attempts
+                """,
+                (now, now - self.lease_seconds, now, now - self.lease_seconds, limit),
+            ).fetchall()
+        events = [
+            {"id": row[0], "user_id": row[1], "paper": json.loads(row[2]), "interaction": row[3],
+             "created_at": row[4], "attempts": row[5]}
+            for row in rows
+        ]
+        return sorted(events, key=lambda event: event["id"])
+
+    def ack(self, event_ids: List[int]):
+        """Delete applied events."""
+        with self._lock:
+            for start in range(0, len(event_ids), 500):
+                batch = event_ids[start:start + 500]
+                self._conn.execute(f"DELETE FROM events WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def release(self, event_ids: List[int]):
+        """Give claimed events back without counting an attempt (e.g. when shutting down mid-batch)."""
+        with self._lock:
+            for start in range(0, len(event_ids), 500):
+                batch = event_ids[start:start + 500]
+                self._conn.execute(
+                    f"UPDATE events SET claimed_at = NULL WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+
+    def fail(self, event_ids: List[int], error: str = "") -> int:
+        """
+        Record a failed attempt of claimed events: they are released for a
+        retry after a backoff, or dead-lettered once they reach `max_attempts`.
+        Returns the number of events dead-lettered.
+        """
+        now = time.time()
+        dead = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(event_ids), 500):
+                    batch = event_ids[start:start + 500]
+                    placeholders = ','.join('?' * len(batch))
+                    self._conn.execute(
+                        f"""
+                        UPDATE events SET claimed_at = NULL, attempts = attempts + 1,
+                            available_at = ? + ? * (1 << MIN(attempts, 16))
+                        WHERE id IN ({placeholders})
+                        """,
+                        (now, self.retry_delay, *batch),
+                    )
+                    dead += self._conn.execute(
+                        f"""
+                        INSERT INTO dead_letter (id, user_id, paper, interaction, created_at, attempts, error, failed_at)
+                        SELECT id, user_id, paper, interaction, created_at, attempts, ?, ?
+                        FROM events WHERE id IN ({placeholders}) AND attempts >= ?
+                        """,
+                        (error, now, *batch, self.max_attempts),
+                    ).rowcount
+                    self._conn.execute(
+                        f"DELETE FROM events WHERE id IN ({placeholders}) AND attempts >= ?",
+                        (*batch, self.max_attempts),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dead
+
+    def requeue_dead_letters(self, event_ids: Optional[List[int]] = None) -> int:
+        """
+        Move dead-lettered events (all, or those in `event_ids`) back into the
+        queue with a fresh attempt count. Returns the number requeued.
+        """
+        where = ""
+        params: tuple = ()
+        if event_ids is not None:
+            if not event_ids:
+                return 0
+            where = f"WHERE id IN ({','.join('?' * len(event_ids))})"
+            params = tuple(event_ids)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requeued = self._conn.execute(
+                    f"""
+                    INSERT INTO events (id, user_id, paper, interaction, created_at)
+                    SELECT id, user_id, paper, interaction, created_at FROM dead_letter {where}
+                    """,
+                    params,
+                ).rowcount
+                self._conn.execute(f"DELETE FROM dead_letter {where}", params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if requeued:
+            self.appended.set()
+        return requeued
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending, claimed, retrying = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(claimed_at IS NOT NULL), 0), COALESCE(SUM(attempts > 0), 0) FROM events"
+            ).fetchone()
+            dead_letter = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+        return {"path": self.path, "pending": pending, "claimed": claimed, "retrying": retrying, "dead_letter": dead_letter}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def apply_interactions(db, events: List[Dict[str, Any]]) -> int:
+    """
+    Apply a batch of interaction events with one bulk write.
+
+    Each user's events of the batch are one UserEmbeddingService update
+    (EMA towards the mean of the weighted paper embeddings, temporal decay,
+    normalization), computed for all users at once; category preference
+    deltas are summed per user. The feeds of users who drifted are re-ranked
+    from the new embeddings, and everything is committed together.
+    Returns the number of users updated.
+    """
+    lookup = get_paper_lookup()
+    paper_embeddings = lookup.get_many([event["paper"]["id"] for event in events])
+    missing = {event["paper"]["id"] for event in events} - set(paper_embeddings)
+    if missing:
+        logger.error(f"Skipping interactions with {len(missing)} papers not found in FAISS index: {sorted(missing)[:10]}")
+
+    # Category preferences: summed deltas, one update per user
+    category_deltas: Dict[str, Dict[str, float]] = {}
+    for event in events:
+        deltas = category_deltas.setdefault(event["user_id"], {})
+        for category, weight in user_paper_interaction(event["paper"], event["interaction"]).items():
+            deltas[category] = deltas.get(category, 0.0) + weight
+    for user_id, deltas in category_deltas.items():
+        if deltas:
+            update_user_preferences(db, user_id, deltas, commit=False)
+
+    # User embeddings: (events x dim) paper matrix, grouped by user index
+    applied = [event for event in events if event["paper"]["id"] in paper_embeddings]
+    user_ids = list(dict.fromkeys(event["user_id"] for event in applied))
+    if applied:
+        positions = {user_id: i for i, user_id in enumerate(user_ids)}
+        # Locked until the commit, in a fixed order, against other writers of these users
+        rows = {
+            str(row.user_id): row
+            for row in db.query(UserEmbedding)
+            .filter(UserEmbedding.user_id.in_([int(u) for u in user_ids]))
+            .order_by(UserEmbedding.user_id)
+            .with_for_update()
+            .all()
+        }
+        current, days_since_update = embedding_service.current_embeddings(user_ids, rows)
+        new_embeddings = embedding_service.batch_update_embeddings(
+            current,
+            days_since_update,
+            user_index=np.array([positions[event["user_id"]] for event in applied]),
+            paper_embeddings=np.stack([paper_embeddings[event["paper"]["id"]] for event in applied]),
+            weights=np.array([INTERACTIONS[event["interaction"]].value for event in applied], dtype=np.float32),
+        )
+
+        statement = insert(UserEmbedding).values([
+            {"user_id": int(user_id), "embedding": embedding.tolist()}
+            for user_id, embedding in zip(user_ids, new_embeddings)
+        ])
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[UserEmbedding.user_id],
+            set_={"embedding": statement.excluded.embedding, "updated_at": func.now()},
+        ))
+        # Re-ranks only the feeds whose user drifted enough
+        refresh_feeds(db, {int(user_id): embedding.tolist() for user_id, embedding in zip(user_ids, new_embeddings)}, commit=False)
+
+    db.commit()
+    return len(user_ids)
+
+
+class InteractionWorker:
+    """
+    Background thread draining an InteractionQueue in batches of up to
+    `batch_size` events through apply_interactions(). It wakes as soon as an
+    event is appended in-process, and every `poll_interval` seconds otherwise
+    (events appended by other processes).
+
+    A batch that fails with one of EVENT_ERRORS is rolled back and
+    re-applied one user at a time, then one event at a time, so a bad event
+    only fails itself; the queue retries or dead-letters it (see
+    InteractionQueue.fail). Any other error releases the unsettled events
+    without counting an attempt, and the worker waits `poll_interval`.
+    """
+
+    def __init__(self, queue: InteractionQueue, batch_size: int = 512, poll_interval: float = 2.0):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.batches = 0
+        self.events = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="interaction-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.queue.appended.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def process_batch(self) -> int:
+        """Claim and apply one batch; returns the number of events claimed."""
+        events = self.queue.claim(self.batch_size)
+        if not events:
+            return 0
+        settled: Set[int] = set()
+        try:
+            self.events += self._apply(events, settled)
+        except Exception as e:
+            logger.error(f"Error applying interaction events, {len(events) - len(settled)} released for a retry: {str(e)}")
+            self.queue.release([event["id"] for event in events if event["id"] not in settled])
+            raise
+        self.batches += 1
+        return len(events)
+
+    def _apply(self, events: List[Dict[str, Any]], settled: Set[int]) -> int:
+        """
+        Apply events in one transaction, splitting them on an EVENT_ERRORS
+        failure; returns the number applied. Ids of events that were acked or
+        failed are added to `settled`.
+        """
+        try:
+            with get_db() as db:
+                try:
+                    apply_interactions(db, events)
+                except Exception:
+                    db.rollback()
+                    raise
+        except EVENT_ERRORS as e:
+            if len(events) == 1:
+                event = events[0]
+                logger.error(f"Error applying interaction event {event['id']} (attempt {event['attempts'] + 1}): {str(e)}")
+                if self.queue.fail([event["id"]], str(e)):
+                    logger.error(f"Interaction event {event['id']} moved to the dead letter table")
+                settled.add(event["id"])
+                return 0
+
+            by_user: Dict[str, List[Dict[str, Any]]] = {}
+            for event in events:
+                by_user.setdefault(event["user_id"], []).append(event)
+            parts = list(by_user.values()) if len(by_user) > 1 else [[event] for event in events]
+            logger.warning(f"Error applying {len(events)} interaction events ({str(e)}); retrying in {len(parts)} parts")
+            return sum(self._apply(part, settled) for part in parts)
+
+        self.queue.ack([event["id"] for event in events])
+        settled.update(event["id"] for event in events)
+        return len(events)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.queue.appended.clear()
+            try:
+                applied = self.process_batch()
+            except Exception:
+                applied = 0
+                # Don't spin on a failing batch
+                self._stop.wait(self.poll_interval)
+            if applied < self.batch_size:
+                self.queue.appended.wait(self.poll_interval)
+
+
+_interaction_queue: Optional[InteractionQueue] = None
+_interaction_queue_lock = threading.Lock()
+
+
+def get_interaction_queue() -> InteractionQueue:
+    """Process-wide InteractionQueue on DEFAULT_QUEUE_PATH."""
+    global _interaction_queue
+    with _interaction_queue_lock:
+        if _interaction_queue is None:
+            _interaction_queue = InteractionQueue()
+        return _interaction_queue
@@ -0,0 +1,63 @@
+"""
+Word chunking (chunk_text) vs. token-aware chunking (chunk_tokens): chunks
+per second, and how much of each chunk the embedder actually sees.
+
+A chunk is "truncated" when it is longer than the embedder's window
+(embed_text() uses max_length=512 tokens, special tokens included); the
+dropped-token rate is the share of chunk tokens cut off that way.
+
+Usage:
+    export PYTHONPATH=.
+    python scripts/benchmark_chunker.py storage/processed/*/text.txt
+    python scripts/benchmark_chunker.py            # synthetic paper
+"""
+import argparse
+import time
+
+from scripts.benchmark_embedding import paper_chunks
+
+
+def window_stats(tokenizer, chunks: list, max_tokens: int):
+    lengths = [len(ids) for ids in tokenizer(chunks, add_special_tokens=True, verbose=False)["input_ids"]]
+    truncated = sum(length > max_tokens for length in lengths)
+    dropped = sum(max(length - max_tokens, 0) for length in lengths)
+    return truncated / max(len(lengths), 1), dropped / max(sum(lengths), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("text_files", nargs="*")
+    parser.add_argument("--chunk-size", type=int, default=400, help="words per chunk_text() chunk")
+    parser.add_argument("--overlap", type=int, default=10)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--token-overlap", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from agents.lib.chunker import TextChunker
+
+    texts = []
+    for path in args.text_files:
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    if not texts:
+        texts = [" ".join(paper_chunks(200))]
+
+    chunker = TextChunker(chunk_size=args.chunk_size, overlap=args.overlap,
+                          max_tokens=args.max_tokens, token_overlap=args.token_overlap)
+    tokenizer = chunker.tokenizer
+
+    print(f"{'mode':>8} {'chunks':>7} {'chunks/s':>10} {'truncated':>10} {'tokens dropped':>15}")
+    for mode, chunk in [("words", chunker.chunk_text), ("tokens", chunker.chunk_tokens)]:
+        chunks = [c for text in texts for c in chunk(text)]
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            for text in texts:
+                chunk(text)
+        rate = len(chunks) * args.repeat / (time.perf_counter() - t0)
+        truncated, dropped = window_stats(tokenizer, chunks, args.max_tokens)
+        print(f"{mode:>8} {len(chunks):>7} {rate:>10.1f} {truncated:>10.1%} {dropped:>15.1%}")
+
+
+if __name__ == "__main__":
+    main()
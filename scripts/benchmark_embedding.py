@@ -0,0 +1,93 @@
+"""
+Text embedding throughput / peak memory of MultimodalEmbedder for one paper,
+single padded batch vs. length-bucketed micro-batches.
+
+The paper is a text file split into `--chunks` chunks of varying length
+(like TextChunker output: most chunks full, a tail of short ones), or a
+synthetic one if no file is given. Each configuration runs in a fresh
+process so peak RSS is not inherited from the previous run.
+
+Usage:
+    export PYTHONPATH=.
+    python scripts/benchmark_embedding.py --chunks 200 --batch-sizes 0 8 16 32 64
+    python scripts/benchmark_embedding.py --text-file storage/processed/paper_x/text.txt
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import time
+import numpy as np
+
+
+def paper_chunks(n_chunks: int, text_file: str = None, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    if text_file:
+        with open(text_file, "r", encoding="utf-8") as f:
+            words = f.read().split()
+    else:
+        vocab = ["model", "attention", "layer", "training", "we", "propose", "results", "dataset",
+                 "the", "of", "and", "a", "loss", "figure", "table", "method", "baseline", "show"]
+        words = list(rng.choice(vocab, size=n_chunks * 400))
+
+    # ~70% near-full chunks, the rest short (captions, headers, section tails)
+    lengths = np.where(rng.random(n_chunks) < 0.7, rng.integers(300, 400, n_chunks), rng.integers(10, 120, n_chunks))
+    chunks, start = [], 0
+    for length in lengths:
+        if start + length > len(words):
+            start = 0
+        chunks.append(" ".join(words[start:start + length]))
+        start += length
+    return chunks
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+
+def run(batch_size: int, chunks: list, clip: bool, queue):
+    from agents.data.embedding import MultimodalEmbedder
+
+    embedder = MultimodalEmbedder(batch_size=batch_size or None)
+    embed = embedder.embed_text_using_clip if clip else embedder.embed_text
+    embed(chunks[:4])  # warm-up
+    loaded_mb = rss_mb()
+
+    t0 = time.perf_counter()
+    embeddings = embed(chunks)
+    elapsed = time.perf_counter() - t0
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((len(embeddings) / elapsed, loaded_mb, peak_mb, np.asarray(embeddings, dtype=np.float32)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--text-file", default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[0, 8, 16, 32, 64],
+                        help="0 = the whole paper as one padded batch")
+    parser.add_argument("--clip", action="store_true", help="benchmark embed_text_using_clip instead of BGE")
+    args = parser.parse_args()
+
+    chunks = paper_chunks(args.chunks, args.text_file)
+    ctx = mp.get_context("spawn")
+    reference = None
+
+    print(f"{'batch_size':>10} {'chunks/s':>10} {'RSS loaded MB':>14} {'peak RSS MB':>12} {'max |diff|':>11}")
+    for batch_size in args.batch_sizes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run, args=(batch_size, chunks, args.clip, queue))
+        proc.start()
+        rate, loaded_mb, peak_mb, embeddings = queue.get()
+        proc.join()
+
+        if reference is None:
+            reference = embeddings
+        diff = float(np.abs(embeddings - reference).max())
+        label = "all" if batch_size == 0 else str(batch_size)
+        print(f"{label:>10} {rate:>10.1f} {loaded_mb:>14.0f} {peak_mb:>12.0f} {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
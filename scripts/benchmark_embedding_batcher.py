@@ -0,0 +1,63 @@
+"""
+Latency / throughput of query embedding under concurrent chat load:
+per-request embed_text([query]) vs. the dynamic-batching EmbeddingBatcher.
+
+`--clients` threads each send `--requests` single-query embeddings back to
+back (like concurrent Flask requests); reports p50 / p99 latency and total
+queries per second for both modes.
+
+Usage:
+    export PYTHONPATH=.
+    python scripts/benchmark_embedding_batcher.py --clients 16 --requests 20 --max-wait-ms 5
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from scripts.benchmark_embedding import paper_chunks
+
+
+def run_clients(embed, queries: list, clients: int, requests: int):
+    def client(c: int) -> list:
+        latencies = []
+        for r in range(requests):
+            query = queries[(c * requests + r) % len(queries)]
+            t0 = time.perf_counter()
+            embed([query])
+            latencies.append(time.perf_counter() - t0)
+        return latencies
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = np.concatenate(list(pool.map(client, range(clients))))
+    return latencies * 1000, len(latencies) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from agents.data.embedding import MultimodalEmbedder
+    from agents.data.embedding_batcher import EmbeddingBatcher
+
+    # Short, distinct queries; no cache so every call reaches the model
+    queries = [chunk[:120] for chunk in paper_chunks(args.clients * args.requests, seed=1)]
+    embedder = MultimodalEmbedder()
+    embedder.embed_text(queries[:4])  # load + warm-up
+    batcher = EmbeddingBatcher(embedder, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    print(f"{'mode':>12} {'p50 ms':>8} {'p99 ms':>8} {'queries/s':>10}")
+    for mode, embed in [("per-request", embedder.embed_text), ("batched", batcher.embed_text)]:
+        latencies, rate = run_clients(embed, queries, args.clients, args.requests)
+        print(f"{mode:>12} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f} {rate:>10.1f}")
+    print(batcher.get_stats())
+    batcher.close()
+
+
+if __name__ == "__main__":
+    main()
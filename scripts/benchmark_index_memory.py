@@ -0,0 +1,91 @@
+"""
+Per-worker memory of N serving processes loading the same FAISSIndex,
+with the default private load vs. load(read_only=True).
+
+Each worker loads the index, runs a few searches and reports its RSS and
+PSS (proportional set size: shared pages are split between the processes
+mapping them) while all workers are alive. With read-only loading the
+index pages are shared, so PSS per worker drops roughly by a factor N.
+
+Usage (Linux only, reads /proc/self/smaps_rollup):
+    export PYTHONPATH=.
+    python scripts/benchmark_index_memory.py --n 200000 --workers 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import numpy as np
+
+from agents.data.indexing import FAISSIndex
+
+
+def memory_mb() -> dict:
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Dirty:"):
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return values
+
+
+def worker(index_path: str, dim: int, read_only: bool, barrier, queue):
+    before = memory_mb()
+    index = FAISSIndex(dim=dim, index_path=index_path)
+    index.load(read_only=read_only)
+    queries = np.random.default_rng(os.getpid()).normal(size=(32, dim)).astype(np.float32)
+    index.search_batch(queries, top_k=10)
+
+    # Measure while every worker holds the index, so shared pages are split
+    barrier.wait()
+    after = memory_mb()
+    barrier.wait()
+    queue.put({key: after[key] - before[key] for key in after})
+
+
+def build_index(path: str, n: int, dim: int) -> str:
+    """Build and save the index; returns the .faiss file of its base."""
+    rng = np.random.default_rng(0)
+    index = FAISSIndex(dim=dim, index_path=path)
+    for start in range(0, n, 10_000):
+        batch = rng.normal(size=(min(10_000, n - start), dim)).astype(np.float32)
+        metas = [{"paper_id": str((start + i) // 30), "chunk_type": "text", "content": "x" * 2000}
+                 for i in range(len(batch))]
+        index.add_embeddings(batch, metas)
+    index.save()
+    return index.base_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bench_index.faiss")
+        base_path = build_index(path, args.n, args.dim)
+        print(f"index: {args.n} x {args.dim}  ({os.path.getsize(base_path) / 1e6:.0f} MB on disk)")
+
+        for read_only in (False, True):
+            barrier = ctx.Barrier(args.workers)
+            queue = ctx.Queue()
+            procs = [ctx.Process(target=worker, args=(path, args.dim, read_only, barrier, queue))
+                     for _ in range(args.workers)]
+            for p in procs:
+                p.start()
+            stats = [queue.get() for _ in procs]
+            for p in procs:
+                p.join()
+
+            label = "read_only=True " if read_only else "read_only=False"
+            for key in ("Rss", "Pss", "Private_Dirty"):
+                values = [s[key] for s in stats]
+                print(f"{label}  {key:<14} per worker {np.mean(values):8.1f} MB   total {np.sum(values):8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Parity and CPU throughput of the ONNX Runtime backend of MultimodalEmbedder
+(fp32 and dynamic int8) against the PyTorch backend.
+
+For BGE text, CLIP text and (with --images) CLIP image embeddings, every
+ONNX vector must have cosine >= --min-cosine with the torch vector of the
+same input; the script exits non-zero otherwise, so it doubles as the
+parity check after re-exporting the models.
+
+Usage:
+    export PYTHONPATH=.
+    python scripts/benchmark_onnx_backend.py --chunks 200
+    python scripts/benchmark_onnx_backend.py --images storage/processed/paper_x/images/*.png
+"""
+import argparse
+import sys
+import time
+import numpy as np
+
+from scripts.benchmark_embedding import paper_chunks
+
+
+def timed(embed, inputs):
+    embed(inputs[:4])  # warm-up
+    t0 = time.perf_counter()
+    embeddings = np.asarray(embed(inputs), dtype=np.float32)
+    return embeddings, len(inputs) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--text-file", default=None)
+    parser.add_argument("--images", nargs="*", default=[])
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    from agents.data.embedding import MultimodalEmbedder
+
+    chunks = paper_chunks(args.chunks, args.text_file)
+    encoders = [("bge text", "embed_text", chunks), ("clip text", "embed_text_using_clip", chunks)]
+    if args.images:
+        encoders.append(("clip image", "embed_images", args.images))
+
+    backends = [
+        ("torch", MultimodalEmbedder(backend="torch")),
+        ("onnx fp32", MultimodalEmbedder(backend="onnx", quantize=False)),
+        ("onnx int8", MultimodalEmbedder(backend="onnx", quantize=True)),
+    ]
+
+    failed = False
+    print(f"{'encoder':>10} {'backend':>10} {'items/s':>9} {'speedup':>8} {'min cos':>8} {'mean cos':>9}")
+    for label, method, inputs in encoders:
+        reference, reference_rate = None, None
+        for name, embedder in backends:
+            embeddings, rate = timed(getattr(embedder, method), inputs)
+            if reference is None:
+                reference, reference_rate = embeddings, rate
+            # Both sides are L2-normalized
+            cosine = (embeddings * reference).sum(axis=1)
+            failed |= bool(cosine.min() < args.min_cosine)
+            print(f"{label:>10} {name:>10} {rate:>9.1f} {rate / reference_rate:>7.2f}x {cosine.min():>8.4f} {cosine.mean():>9.4f}")
+
+    if failed:
+        print(f"Parity check failed: some cosine < {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
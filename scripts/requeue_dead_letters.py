@@ -0,0 +1,26 @@
+"""
+Put dead-lettered interaction events back into the queue, e.g. after fixing
+what made them fail. With no ids every dead letter is requeued.
+
+Usage:
+    export PYTHONPATH=.
+    python scripts/requeue_dead_letters.py            # all dead letters
+    python scripts/requeue_dead_letters.py 12 57      # only these event ids
+"""
+import argparse
+
+from backend.app.services.interaction_queue import get_interaction_queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("event_ids", type=int, nargs="*", help="dead-lettered event ids (default: all)")
+    args = parser.parse_args()
+
+    queue = get_interaction_queue()
+    requeued = queue.requeue_dead_letters(args.event_ids or None)
+    print(f"Requeued {requeued} events; {queue.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()